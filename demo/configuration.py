@@ -70,5 +70,12 @@ app.define_categories(
 # Rules
 ##############################################
 
+# Rules only categorize the transactions that the importer left without a category
+app.define_rules(
+    Rule(counterpart='Transport Company',   category='Expense/Transport'),
+    Rule(desc='Rent',                       category='Expense/Housing', amount_max=0),
+    Rule(desc='Salary',                     category='Income/Salary', amount_min=0),
+)
+
 app.import_file('bank', './gen/out/bank_2021.csv')
 app.import_file('paypal', './gen/out/paypal_2021.csv')
\ No newline at end of file
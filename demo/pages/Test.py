@@ -1,9 +1,11 @@
 import streamlit as st
 
 from monjour.st import get_st_app
+from monjour.st.components.common.app_loading import wait_for_app
 
 st_app = get_st_app(st.session_state.project_dir)
-df = st_app.app.df.copy()
+wait_for_app(st_app)
+df = st_app.view()
 
 st.title("Demo report")
 
@@ -1 +1,6 @@
-from monjour.prelude import *
\ No newline at end of file
+from monjour.core.globals import MONJOUR_VERSION as __version__
+from monjour.utils.lazy_import import lazy_attributes
+from monjour.prelude import __all__
+
+# Same names as monjour.prelude, imported on first use so that `import monjour` stays cheap
+__getattr__, __dir__ = lazy_attributes(__name__, { name: 'monjour.prelude' for name in __all__ })
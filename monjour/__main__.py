@@ -5,9 +5,15 @@ import json
 import importlib.resources as resources
 
 import monjour.core.log as log
-from monjour.core.globals import MONJOUR_DEBUG, MONJOUR_LOG_LEVEL
+from monjour.core.globals import MONJOUR_DEBUG, MONJOUR_LOG_LEVEL, MONJOUR_VERSION
+
+# Headless commands (import, run, export, report, watch) never load the UI stack
+if len(sys.argv) > 1 and sys.argv[1] in ('import', 'run', 'export', 'report', 'watch'):
+    from monjour.cli import main
+    sys.exit(main(sys.argv[1:]))
 
 parser = argparse.ArgumentParser()
+parser.add_argument('--version', action='version', version=f'monjour {MONJOUR_VERSION}')
 # parser.add_argument('--init', action='store_true', help='Initialize a project in the current directory')
 parser.add_argument('--console', action='store_true', help='Launch the separate admin console')
 parser.add_argument('--debug', action='store_true', help='Enable debug mode')
@@ -73,4 +79,5 @@ if args.streamlit or args.demo:
     # run the streamlit script on a different thread
     stcli.main()
 else:
-    print("For now only Streamlit is supported. Re-run with --st to start the streamlit server.")
\ No newline at end of file
+    print("Re-run with --st to start the streamlit server, or use one of the headless commands: "
+          "import, run, export, report, watch (python -m monjour <command> --help).")
\ No newline at end of file
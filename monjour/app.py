@@ -1,32 +1,93 @@
 import os
+import itertools
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
-from typing import IO, Any, Callable
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import IO, Any, Callable, Iterable, Literal, Mapping
 
 from monjour.core.executor import Executor
 from monjour.core.log import MjLogger
 from monjour.core.common import DateRange
 from monjour.core.config import Config
 from monjour.core.account import Account
-from monjour.core.category import Category
-from monjour.core.archive import Archive
+from monjour.core.category import Category, CategoryTree
+from monjour.core.archive import Archive, ArchiveID, ArchiveOperationResult
+from monjour.core.cube import AggregateCube
+from monjour.core.fx import CurrencyNormalizer, FxRates
+from monjour.core.memo import save_memos
+from monjour.core.snapshot import AppSnapshot
+from monjour.core.rule import Rule, RuleEngine
 from monjour.core.merge import MergeContext, Merger, DEFAULT_MERGE_EXECUTOR
 from monjour.core.importer import ImportContext, DEFAULT_IMPORT_EXECUTOR
+from monjour.inbox import Inbox
+from monjour.utils.diagnostics import DiagnosticCollector
 
 log = MjLogger(__name__)
 
+# Versions of the snapshots are unique across all the App instances of the process,
+# so that caches shared between apps (e.g. the streamlit result cache) can be keyed on them
+_df_versions = itertools.count(1)
+
+@dataclass
+class RunProgress:
+    """
+    Progress of App.run, reported to the progress callback after every step.
+
+    Attributes:
+        stage:          What the app is doing.
+        files_loaded:   Number of archived files loaded so far.
+        files_total:    Number of archived files to load.
+        account_id:     Account currently being loaded, if any.
+    """
+    stage: Literal['loading', 'merging', 'done']
+    files_loaded: int = 0
+    files_total: int = 0
+    account_id: str|None = None
+
+    @property
+    def fraction(self) -> float:
+        if self.stage == 'done':
+            return 1.0
+        # Keep some room for the merge
+        return 0.9 * self.files_loaded / max(self.files_total, 1)
+
 class App:
+    """
+    The application: configuration, accounts, archive and the master account.
+
+    Thread safety: all the operations that modify the state (imports, merges, run) hold write_lock
+    and publish a new immutable AppSnapshot when they are done. Concurrent readers should take
+    App.snapshot once and read from it instead of reading the attributes of the App.
+    """
     config: Config
     archive: Archive
     accounts: dict[str, Account]
     categories: dict[str, Category]
+    category_tree: CategoryTree
+    rules: RuleEngine
 
-    df: pd.DataFrame # Master account
+    # Mergers that run on the master account after all the accounts have been merged
+    merge_stages: list[Merger]
+    # Folder watched for new files (see define_inbox)
+    inbox: Inbox|None
+
+    # Daily sums and counts of the master account, updated after each merge (by the writer)
+    cube: AggregateCube
+    # Held by every operation that modifies the state
+    write_lock: threading.RLock
     df_listeners: list[Callable[[pd.DataFrame], None]] = []
 
     cli_args: dict[str, Any]
 
+    # Incremented whenever the merge configuration changes (rules, merge stages...)
+    _merge_generation: int
+    # Last published state
+    _snapshot: AppSnapshot
+
     ##############################################
     # Configuration
     ##############################################
@@ -36,7 +97,14 @@ class App:
         self.archive = Archive(Path(config.appdata_dir) / 'archive') if archive is None else archive
         self.accounts = {}
         self.categories = {}
-        self.df = pd.DataFrame()
+        self.category_tree = CategoryTree()
+        self.rules = RuleEngine()
+        self.merge_stages = []
+        self.inbox = None
+        self.cube = AggregateCube()
+        self.write_lock = threading.RLock()
+        self._merge_generation = 0
+        self._snapshot = AppSnapshot.empty()
         self.df_listeners = []
         self.cli_args = json.loads(os.environ.get('MONJOUR_APP_ARGS', '{}'))
 
@@ -47,7 +115,62 @@ class App:
 
     def define_categories(self, *categories: Category):
         for category in categories:
-            self.categories[category.name] = category
+            # Subcategories are registered with their full path (e.g. 'Expenses/Food')
+            for c in category.flatten():
+                self.categories[c.name] = c
+            self.category_tree.add_category(category)
+
+    def define_rules(self, *rules: Rule, overwrite: bool|None = None):
+        """
+        Define categorization rules. The rules are applied to the master account right after
+        all the accounts have been merged (see monjour.core.rule.RuleEngine).
+
+        Args:
+            rules:      Rules to add to the rule engine.
+            overwrite:  If set, whether the rules can override the categories assigned by the importers.
+        """
+        self.rules.add(*rules)
+        if overwrite is not None:
+            self.rules.overwrite = overwrite
+        self._merge_generation += 1
+        if self.rules.merger not in self.merge_stages:
+            self.define_merge_stages(self.rules.merger)
+
+    def define_merge_stages(self, *stages: Merger):
+        """
+        Define mergers that run, in order, on the master account after all the accounts have been merged.
+        """
+        self.merge_stages.extend(stages)
+        self._merge_generation += 1
+
+    def define_fx_rates(self, rates: FxRates|str|Path) -> CurrencyNormalizer:
+        """
+        Convert the transactions to the reporting currency (Config.currency) after the merge: adds
+        the 'amount_base' column to the master account, which the aggregates use instead of 'amount'
+        (see monjour.core.fx).
+
+        Args:
+            rates:  The exchange rates, or a CSV/Parquet rate table relative to the project directory
+                    (see FxRates.load).
+        """
+        if not isinstance(rates, FxRates):
+            rates = FxRates.load(rates, self.config.currency)
+        normalizer = CurrencyNormalizer(rates)
+        self.define_merge_stages(normalizer.merger)
+        return normalizer
+
+    def define_inbox(self, directory: str|Path, patterns: Mapping[str, str|list[str]], poll_interval: float = 5.0) -> Inbox:
+        """
+        Define a folder watched for new statements (see monjour.inbox.Inbox). The streamlit app starts
+        watching it after the first run, the headless 'watch' command after App.run.
+
+        Args:
+            directory:      The folder, relative to the project directory.
+            patterns:       Glob patterns of the files of each account, by account ID (e.g. { 'bank': 'bank_*.csv' }).
+            poll_interval:  Seconds between two scans of the folder.
+        """
+        self.inbox = Inbox(self, directory, patterns, poll_interval)
+        return self.inbox
 
     ##############################################
     # Public API
@@ -58,16 +181,54 @@ class App:
         from monjour.replay.app_interactive import AppInteractive
         return AppInteractive(self)
 
+    @property
+    def snapshot(self) -> AppSnapshot:
+        """The last published state of the app. Safe to read while other threads import or merge."""
+        return self._snapshot
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The master account (of the last published snapshot)."""
+        return self._snapshot.df
+
+    @property
+    def df_version(self) -> int:
+        """
+        Version of the last published snapshot. Versions are unique across all the App instances of
+        the process, caches of data derived from the master account are keyed on it.
+        """
+        return self._snapshot.version
+
+    @property
+    def category_rollup(self) -> pd.DataFrame:
+        """Monthly totals of every node of the category tree (of the last published snapshot)."""
+        return self._snapshot.category_rollup
+
+    @property
+    def buckets(self) -> pd.DataFrame:
+        """
+        The 'day', 'week', 'month' and 'year' columns of the master account (aligned with App.df),
+        holding the start of the period of each transaction. Computed once per snapshot.
+        """
+        return self._snapshot.buckets
+
     def import_file(self, account_id: str, filename: str|Path, date_range: DateRange|None = None,
-                    executor: Executor[ImportContext, pd.DataFrame] = DEFAULT_IMPORT_EXECUTOR):
+                    executor: Executor[ImportContext, pd.DataFrame] = DEFAULT_IMPORT_EXECUTOR) -> ImportContext:
         """
         Import a file into the account with the given ID.
 
+        Files already in the archive (same path, account and importer) are not imported again: if the
+        size and modification time of the file didn't change the file isn't even read, otherwise only
+        its hash is computed. Nothing is written to the archive and the result is Unchanged; the
+        transactions of the file are loaded from the archive by App.run like any other archived file.
+
         Args:
             account_id: ID of the account to import the file into.
             file:       Path to the file to import.
             date_range: Optional date range to associate with the file. If not provided,
                         the date range will be inferred from the filename.
+        Returns:
+            The import context, holding the diagnostics of the import.
         Throws:
             ValueError: If the account ID is not found.
             ValueError: If the date range cannot be inferred from the filename and none is provided.
@@ -75,37 +236,144 @@ class App:
         if isinstance(filename, Path):
             filename = str(filename)
         account = self.accounts[account_id]
-        importer = account.importer
 
-        with open(filename, 'rb') as f:
-            if date_range is None:
-                date_range = importer.try_infer_daterange(f, filename)
-            archive_id = self.archive.calculate_archive_id(account.id, f)
-        ctx = ImportContext(
-            self.accounts[account_id],
-            self.archive,
-            archive_id,
-            date_range=date_range,
-            filename=filename,
-            importer_id=importer.info.id,
-            executor=executor,
-        )
-        ctx = account.import_file(ctx)
+        with self.write_lock:
+            archive_id, ctx = self._unchanged_import(account, filename, date_range, executor)
+            if ctx is not None:
+                self._remember_stats([ctx])
+                return ctx
+            ctx = self._import_context(account, filename, archive_id, date_range, executor)
+            ctx = account.import_file(ctx)
+            save_memos()
+            self._publish()
+        return ctx
 
-    def run(self):
+    def import_files(self, account_id: str, filenames: Iterable[str|Path], merge: bool = True,
+                     max_workers: int|None = None,
+                     executor: Executor[ImportContext, pd.DataFrame] = DEFAULT_IMPORT_EXECUTOR) -> list[ImportContext]:
+        """
+        Import several files into the account with the given ID in a single operation.
+        See import_files_by_account.
+        """
+        return self.import_files_by_account({ account_id: filenames }, merge=merge, max_workers=max_workers,
+                                            executor=executor)
+
+    def import_files_by_account(self, files: Mapping[str, Iterable[str|Path]], merge: bool = True,
+                                max_workers: int|None = None,
+                                executor: Executor[ImportContext, pd.DataFrame] = DEFAULT_IMPORT_EXECUTOR
+                                ) -> list[ImportContext]:
+        """
+        Import many files, possibly into different accounts, in a single operation:
+        - The files are hashed and parsed in parallel.
+        - They are all registered in the archive in one transaction (archive.json is written once).
+        - The transactions of each account are merged into it at once.
+        - The accounts are merged into the master account once (if merge is True).
+
+        The operation is all or nothing: if a file can't be parsed, nothing is registered or merged.
+        The date range of every file is inferred by its importer. Files already in the archive are
+        skipped like in import_file.
+
+        Args:
+            files:          Files to import, by account ID.
+            merge:          Merge the accounts at the end (App.merge_accounts).
+            max_workers:    Number of threads parsing the files. Defaults to ThreadPoolExecutor's default.
+            executor:       Executor of the imports.
+        Returns:
+            The import context of each file, in order.
+        Throws:
+            KeyError:   If an account ID is not found.
+        """
+        jobs = [(self.accounts[account_id], str(filename))
+                for account_id, filenames in files.items() for filename in filenames]
+
+        # Runs in the pool: only reads the archive, every change is made below by the calling thread
+        def parse(job: tuple[Account, str]) -> ImportContext:
+            account, filename = job
+            archive_id, ctx = self._unchanged_import(account, filename, None, executor)
+            if ctx is not None:
+                return ctx
+            ctx = self._import_context(account, filename, archive_id, None, executor)
+            account.parse_file(ctx)
+            return ctx
+
+        with self.write_lock:
+            self.archive.ensure_loaded()
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='monjour-import') as pool:
+                contexts = list(pool.map(parse, jobs))
+            save_memos()
+
+            # The same file listed twice would be merged twice
+            unique: dict[ArchiveID, ImportContext] = {}
+            for ctx in contexts:
+                if ctx.archive_operation_result == ArchiveOperationResult.Unchanged:
+                    continue
+                if ctx.archive_id in unique:
+                    log.warning(f"App.import_files: {ctx.filename} is the same file as {unique[ctx.archive_id].filename}, skipped")
+                else:
+                    unique[ctx.archive_id] = ctx
+
+            with self.archive.batch():
+                self._remember_stats([ctx for ctx in contexts
+                                      if ctx.archive_operation_result == ArchiveOperationResult.Unchanged])
+                for ctx in unique.values():
+                    ctx.archive_operation_result = self.archive.register_file(ctx.archive_id, ctx.account.id,
+                                                        ctx.importer_id, ctx.date_range, ctx.filename)
+            if len(unique) == 0:
+                # Every file was already in the archive
+                return contexts
+            for account in {id(ctx.account): ctx.account for ctx in unique.values()}.values():
+                account.merge_fragments([(ctx, ctx.result) for ctx in unique.values() if ctx.account is account])
+
+            log.info(f"App.import_files: imported {len(unique)} files into {len(files)} accounts")
+            if merge:
+                self.merge_accounts()
+            else:
+                self._publish()
+        return contexts
+
+    def run(self, progress: Callable[[RunProgress], None]|None = None) -> list[DiagnosticCollector]:
+        """
+        Load all the archived files and merge the accounts.
+
+        Args:
+            progress: Optional callback receiving the progress of the run after each step.
+
+        Returns:
+            The contexts of the run (one per loaded file, then the merge), holding their diagnostics.
+        """
         log.info("App.run - Running app")
-        self.archive.load()
-        self.load_all_from_archive()
-        self.merge_accounts()
+        with self.write_lock:
+            self.archive.load()
+            contexts: list[DiagnosticCollector] = list(self.load_all_from_archive(progress))
+            if progress is not None:
+                progress(RunProgress('merging', len(self.archive.records), len(self.archive.records)))
+            contexts.append(self.merge_accounts())
+        if progress is not None:
+            progress(RunProgress('done', len(self.archive.records), len(self.archive.records)))
         log.info("App.run - Done")
+        return contexts
 
     ##############################################
     # Semi-Public API
     ##############################################
 
-    def load_all_from_archive(self):
-        for account in self.accounts.values():
-            account.load_all_from_archive(self.archive)
+    def load_all_from_archive(self, progress: Callable[[RunProgress], None]|None = None) -> list[ImportContext]:
+        with self.write_lock:
+            contexts = []
+            total = sum(len(self.archive.get_records_for_account(id)) for id in self.accounts.keys())
+            state = RunProgress('loading', 0, total)
+            for account in self.accounts.values():
+                state.account_id = account.id
+                if progress is not None:
+                    progress(replace(state))
+                def on_file_loaded(_):
+                    state.files_loaded += 1
+                    if progress is not None:
+                        progress(replace(state))
+                contexts.extend(account.load_all_from_archive(self.archive, on_file_loaded))
+            save_memos()
+            self._publish()
+            return contexts
 
     def merge_accounts(
         self,
@@ -119,37 +387,102 @@ class App:
             accounts: List of account IDs to merge. If None, all accounts are merged.
             executor: Executor to use for the merge process.
         """
-        # Filter and reorder the accounts to merge
-        accounts_to_merge = [ self.accounts[id] for id in accounts or self.accounts.keys() ]
+        with self.write_lock:
+            # Filter and reorder the accounts to merge
+            accounts_to_merge = [ self.accounts[id] for id in accounts or self.accounts.keys() ]
 
-        # Setup
-        df = pd.DataFrame() # Start with an empty dataframe
-        ctx = MergeContext(self.categories, accounts_to_merge)
+            # Setup
+            df = pd.DataFrame() # Start with an empty dataframe
+            ctx = MergeContext(self.categories, accounts_to_merge)
 
-        if len(accounts_to_merge) == 0:
-            log.warning("App.merge_accounts: No accounts to merge")
-            return ctx
+            if len(accounts_to_merge) == 0:
+                log.warning("App.merge_accounts: No accounts to merge")
+                return ctx
 
-        block = executor.new_block((ctx, df))
-        # Add all the mergers to the execution block, if the executor is an
-        # ImmediateExecutor, this will run the mergers immediately
-        # Otherwise, the mergers will be run when executor.run() is called
-        for account in accounts_to_merge:
-            block.exec(account.merger)
+            block = executor.new_block((ctx, df))
+            # Add all the mergers to the execution block, if the executor is an
+            # ImmediateExecutor, this will run the mergers immediately
+            # Otherwise, the mergers will be run when executor.run() is called
+            for account in accounts_to_merge:
+                block.exec(account.merger)
+            # Stages that work on the whole master account (rules, etc...)
+            for stage in self.merge_stages:
+                block.exec(stage)
 
-        # Update the master account
-        self.df = block.last_result
-        ctx.result = self.df
+            # Update the aggregates, then publish the new master account in a single step
+            df = block.last_result
+            category_rollup = self._update_aggregates(df, accounts_to_merge)
+            self._publish(df, category_rollup)
+            ctx.result = df
 
-        # Notify listeners
-        for listener_fn in self.df_listeners:
-            listener_fn(self.df)
-        return ctx
+            # Notify listeners
+            for listener_fn in self.df_listeners:
+                listener_fn(df)
+            return ctx
 
     ##############################################
     # Private API
     ##############################################
 
+    def _unchanged_import(self, account: Account, filename: str, date_range: DateRange|None,
+                          executor: Executor[ImportContext, pd.DataFrame]) -> tuple[ArchiveID, ImportContext|None]:
+        """
+        Fast path of the imports: if the file is already in the archive, with the same path, account,
+        importer (and date range if given), return an Unchanged context without parsing it.
+        The stat cache of the archive avoids hashing the file when its size and mtime didn't change.
+        The archive is only read, so this can run in the import pool (see _remember_stats).
+
+        Returns:
+            The archive ID of the file (reused by _import_context, so that the file is hashed once)
+            and the Unchanged context, or None if the file must be imported.
+        """
+        self.archive.ensure_loaded()
+        importer_id = account.importer.info.id
+        if (archive_id := self.archive.find_by_stat(filename)) is None:
+            with open(filename, 'rb') as f:
+                archive_id = self.archive.calculate_archive_id(account.id, f)
+        if (record := self.archive.records.get(archive_id)) is None:
+            return archive_id, None
+        record_range = DateRange(record['date_start'], record['date_end'])
+        if (record['account_id'] != account.id or record['file_path'] != filename
+                or record['importer_id'] != importer_id or record['is_managed_by_archive']
+                or (date_range is not None and date_range != record_range)):
+            return archive_id, None
+        ctx = ImportContext(account, self.archive, archive_id, date_range=record_range, filename=filename,
+                            importer_id=importer_id, executor=executor)
+        ctx.archive_operation_result = ArchiveOperationResult.Unchanged
+        return archive_id, ctx
+
+    def _remember_stats(self, contexts: list[ImportContext]):
+        """
+        Remember the stat of the files found unchanged by _unchanged_import, whose content is known but
+        may have been touched, so that they aren't hashed the next time. The archive is saved once.
+        Must be called with write_lock held.
+        """
+        changed = [self.archive.remember_stat(ctx.filename, ctx.archive_id) for ctx in contexts]
+        if any(changed):
+            self.archive.save()
+
+    def _import_context(self, account: Account, filename: str, archive_id: ArchiveID, date_range: DateRange|None,
+                        executor: Executor[ImportContext, pd.DataFrame]) -> ImportContext:
+        """
+        Build the context of the import of a file, given its archive ID (see _unchanged_import).
+        The date range is inferred by the importer if not given.
+        """
+        importer = account.importer
+        if date_range is None:
+            with open(filename, 'rb') as f:
+                date_range = importer.try_infer_daterange(f, filename)
+        return ImportContext(
+            account,
+            self.archive,
+            archive_id,
+            date_range=date_range,
+            filename=filename,
+            importer_id=importer.info.id,
+            executor=executor,
+        )
+
     def _archive_file(
             self,
             account_id: str,
@@ -159,22 +492,78 @@ class App:
             executor: Executor[ImportContext, pd.DataFrame] = DEFAULT_IMPORT_EXECUTOR
     ) -> ImportContext:
         account = self.accounts[account_id]
-        importer = account.importer
 
-        archive_id = self.archive.calculate_archive_id(account.id, file)
-        date_range = date_range or importer.try_infer_daterange(file, filename)
-        ctx = ImportContext(
-            self.accounts[account_id],
-            self.archive,
-            archive_id,
-            date_range=date_range,
-            filename=filename,
-            importer_id=importer.info.id,
-            executor=executor,
-        )
-        ctx = account.archive_file(ctx, file)
+        with self.write_lock:
+            importer = account.importer
+            archive_id = self.archive.calculate_archive_id(account.id, file)
+            date_range = date_range or importer.try_infer_daterange(file, filename)
+            ctx = ImportContext(
+                self.accounts[account_id],
+                self.archive,
+                archive_id,
+                date_range=date_range,
+                filename=filename,
+                importer_id=importer.info.id,
+                executor=executor,
+            )
+            ctx = account.archive_file(ctx, file)
+            save_memos()
+            self._publish()
         return ctx
 
+    def _forget_file(self, archive_id: ArchiveID):
+        """Remove a file from the archive."""
+        with self.write_lock:
+            self.archive.forget_file(archive_id)
+            self._publish()
+
+    def _publish(self, df: pd.DataFrame|None = None, category_rollup: pd.DataFrame|None = None):
+        """
+        Publish a new snapshot of the state. Must be called with write_lock held.
+        The master account and the category rollup are carried over from the current snapshot if not provided.
+        """
+        current = self._snapshot
+        self._snapshot = AppSnapshot(
+            version=next(_df_versions),
+            df=current.df if df is None else df,
+            accounts_data=MappingProxyType({ id: account.data for id, account in self.accounts.items() }),
+            account_balances=MappingProxyType({ id: account.balance for id, account in self.accounts.items() }),
+            archive_records=MappingProxyType({ id: record.copy() for id, record in self.archive.records.items() }),
+            cube=self.cube.copy(),
+            category_tree=self.category_tree.copy(),
+            category_rollup=current.category_rollup if category_rollup is None else category_rollup,
+        )
+
+    def _update_aggregates(self, df: pd.DataFrame, merged_accounts: list[Account]) -> pd.DataFrame:
+        """
+        Precompute the aggregates derived from the master account. Called after every merge.
+        Only the cube slices of the accounts whose data changed since the last merge are recomputed.
+
+        Returns:
+            The monthly category rollup.
+        """
+        # The merge stages work on the whole master account and can change the rows of any account
+        digests = self.cube.digests(df)
+        signatures = { account.id: (self._account_signature(account), digests.get(account.id))
+                       for account in merged_accounts }
+        updated = self.cube.update(df, signatures, self._merge_generation)
+        log.info(f"App._update_aggregates - Cube updated for {len(updated)} account(s), {len(self.cube)} cells")
+
+        if 'category' not in df.columns:
+            return pd.DataFrame()
+        # Categories used by the importers/rules but never defined still get a node
+        self.category_tree.extend(self.cube.df['category'])
+        return self.category_tree.rollup(self.cube.df, freq='month')
+
+    def _account_signature(self, account: Account):
+        """
+        Signature of the data of an account: the files it was imported from, the importer and
+        the number of transactions loaded. Used with the digest of its merged rows (see
+        AggregateCube.digests) to detect which cube slices are stale.
+        """
+        records = sorted((r['id'], r['file_hash']) for r in self.archive.get_records_for_account(account.id))
+        return (account.importer.info.id, len(account.data), tuple(records))
+
     def _add_df_listener(self, listener_fn: Callable[[pd.DataFrame], None]):
         """
         Add a listener that will be called whenever the master account (App.df) is updated.
@@ -194,6 +583,11 @@ class App:
         app = App(self.config, self.archive)
         app.accounts = self.accounts.copy()
         app.categories = self.categories.copy()
-        app.df = self.df
+        app.category_tree = self.category_tree.copy()
+        app.cube = self.cube.copy()
+        app._merge_generation = self._merge_generation
+        app.rules = self.rules
+        app.merge_stages = self.merge_stages.copy()
+        app._snapshot = self._snapshot
         app.df_listeners = self.df_listeners.copy()
         return app
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Headless commands on top of App, for batch processing (e.g. nightly cron jobs):
+
+    python -m monjour import <account> <files...>
+    python -m monjour run
+    python -m monjour export --format parquet|csv [--output FILE]
+    python -m monjour report <name> [--output FILE]
+    python -m monjour watch
+
+The project's configuration.py is loaded like the streamlit app does, but neither streamlit nor plotly
+are ever imported. The exit status tells whether the command reported diagnostics (see exit_status).
+"""
+import argparse
+import importlib
+import os
+import sys
+import pandas as pd
+from pathlib import Path
+from typing import Callable
+
+from monjour.app import App
+from monjour.core.log import MjLogger
+from monjour.utils.diagnostics import DiagnosticCollector, DiagnosticSeverity
+
+log = MjLogger(__name__)
+
+# Exit statuses
+EXIT_OK = 0
+# The command completed, but reported diagnostics at or above the --fail-on severity
+EXIT_DIAGNOSTICS = 1
+# The command failed (invalid arguments, missing project, exception...)
+EXIT_FAILURE = 2
+
+EXPORT_FORMATS = ['parquet', 'csv']
+
+##############################################
+# Reports
+##############################################
+
+def report_categories(app: App) -> pd.DataFrame:
+    """Total amount and number of transactions of every category (parents include their children)."""
+    snapshot = app.snapshot
+    tree = snapshot.category_tree
+    totals = tree.rollup(snapshot.cube.df).join(tree.to_df(), on='node_id')
+    return totals[['name', 'depth', 'amount', 'count']].sort_values('name').rename(columns={'name': 'category'})
+
+def report_monthly(app: App) -> pd.DataFrame:
+    """Income, expenses and balance of every month."""
+    months = app.snapshot.cube.rollup('month', by=['expense'])
+    totals = months.pivot_table(index='month', columns='expense', values='amount', aggfunc='sum', fill_value=0)
+    return pd.DataFrame({
+        'income': totals.get(False, 0),
+        'expenses': totals.get(True, 0),
+        'balance': totals.sum(axis=1),
+    }).reset_index()
+
+def report_accounts(app: App) -> pd.DataFrame:
+    """Balance (including the opening balance), number of transactions and date range of every account."""
+    snapshot = app.snapshot
+    report = snapshot.cube.df.groupby('account_id', as_index=False).agg(
+        transactions=('count', 'sum'),
+        first=('date', 'min'),
+        last=('date', 'max'),
+    )
+    report.insert(1, 'balance', [snapshot.account_balances[id].current for id in report['account_id']])
+    return report
+
+REPORTS: dict[str, Callable[[App], pd.DataFrame]] = {
+    'categories': report_categories,
+    'monthly': report_monthly,
+    'accounts': report_accounts,
+}
+
+##############################################
+# Commands
+##############################################
+
+def cmd_import(app: App, args: argparse.Namespace) -> list[DiagnosticCollector]:
+    if args.account not in app.accounts:
+        raise ValueError(f"Unknown account '{args.account}'. Accounts: {', '.join(app.accounts)}")
+    # Load the archive table first, so that the new records are added to the existing ones
+    app.archive.load()
+    return app.import_files(args.account, args.files, merge=False)
+
+def cmd_run(app: App, args: argparse.Namespace) -> list[DiagnosticCollector]:
+    return app.run()
+
+def cmd_export(app: App, args: argparse.Namespace) -> list[DiagnosticCollector]:
+    contexts = app.run()
+    output = args.output or Path(os.environ['MONJOUR_ORIGINAL_CWD']) / f"monjour_export.{args.format}"
+    if args.format == 'parquet':
+        app.df.to_parquet(output)
+    else:
+        app.df.to_csv(output)
+    log.info(f"Exported {len(app.df)} transactions to {output}")
+    return contexts
+
+def cmd_report(app: App, args: argparse.Namespace) -> list[DiagnosticCollector]:
+    contexts = app.run()
+    report = REPORTS[args.name](app)
+    if args.output is None:
+        report.to_csv(sys.stdout, index=False)
+    else:
+        report.to_csv(args.output, index=False)
+    return contexts
+
+def cmd_watch(app: App, args: argparse.Namespace) -> list[DiagnosticCollector]:
+    if app.inbox is None:
+        raise ValueError("No inbox defined in configuration.py (see App.define_inbox)")
+    contexts = app.run()
+    try:
+        app.inbox.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return contexts
+
+COMMANDS: dict[str, Callable[[App, argparse.Namespace], list[DiagnosticCollector]]] = {
+    'import': cmd_import,
+    'run': cmd_run,
+    'export': cmd_export,
+    'report': cmd_report,
+    'watch': cmd_watch,
+}
+
+##############################################
+# Entry point
+##############################################
+
+def exit_status(contexts: list[DiagnosticCollector], fail_on: DiagnosticSeverity = DiagnosticSeverity.Error) -> int:
+    """EXIT_DIAGNOSTICS if any context reported a diagnostic at least as severe as fail_on, EXIT_OK otherwise."""
+    for ctx in contexts:
+        for diag in ctx.diagnostics:
+            if diag.type.value <= fail_on.value:
+                return EXIT_DIAGNOSTICS
+    return EXIT_OK
+
+def load_app(project_dir: Path) -> App:
+    """Load the App defined in the configuration.py of a project (same as StApp, without streamlit)."""
+    if not (project_dir / 'configuration.py').exists():
+        raise FileNotFoundError(f"No configuration.py in '{project_dir}'")
+    os.environ.setdefault('MONJOUR_ORIGINAL_CWD', os.getcwd())
+    os.environ['MONJOUR_PROJECT_DIR'] = str(project_dir)
+    os.chdir(project_dir)
+    sys.path.append(str(project_dir))
+    config_module = importlib.import_module('configuration')
+    return config_module.app
+
+def build_parser() -> argparse.ArgumentParser:
+    # Options shared by all the commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-p', '--project', type=Path, default=Path('.'), help='Project directory')
+    common.add_argument('--fail-on', choices=['error', 'warning'], default='error',
+                        help='Lowest diagnostic severity that makes the command exit with status 1')
+
+    parser = argparse.ArgumentParser(prog='monjour', description='Headless monjour commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('import', parents=[common], help='Import files into an account')
+    cmd.add_argument('account', help='ID of the account')
+    cmd.add_argument('files', nargs='+', type=Path, help='Files to import')
+
+    commands.add_parser('run', parents=[common], help='Load the archive and merge the accounts')
+
+    cmd = commands.add_parser('export', parents=[common], help='Run, then export the master account')
+    cmd.add_argument('--format', choices=EXPORT_FORMATS, default='parquet')
+    cmd.add_argument('-o', '--output', type=Path, help='Output file. Defaults to monjour_export.<format>')
+
+    cmd = commands.add_parser('report', parents=[common], help='Run, then write a report as CSV')
+    cmd.add_argument('name', choices=list(REPORTS))
+    cmd.add_argument('-o', '--output', type=Path, help='Output file. Defaults to the standard output')
+
+    commands.add_parser('watch', parents=[common], help='Run, then import the files dropped in the inbox until interrupted')
+    return parser
+
+def main(argv: list[str]|None = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Paths given on the command line are relative to the current directory, not to the project
+    for name in ['files', 'output']:
+        value = getattr(args, name, None)
+        if isinstance(value, list):
+            setattr(args, name, [path.resolve() for path in value])
+        elif value is not None:
+            setattr(args, name, value.resolve())
+    fail_on = DiagnosticSeverity.Warning if args.fail_on == 'warning' else DiagnosticSeverity.Error
+
+    try:
+        app = load_app(args.project.resolve())
+        contexts = COMMANDS[args.command](app, args)
+    except Exception as e:
+        log.error(f"monjour {args.command} failed: {e}")
+        return EXIT_FAILURE
+    return exit_status(contexts, fail_on)
@@ -1,5 +1,14 @@
-from monjour.core.account import Account
-from monjour.core.archive import Archive, ArchiveRecord, ArchiveID
-from monjour.core.config import Config
-from monjour.core.importer import Importer
-from monjour.core.common import DateRange
\ No newline at end of file
+from monjour.utils.lazy_import import lazy_attributes
+
+__all__ = ['Account', 'Archive', 'ArchiveRecord', 'ArchiveID', 'Config', 'Importer', 'DateRange']
+
+# Imported on first use, so that light modules (e.g. monjour.core.log) don't pull in pandas
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    'Account':          'monjour.core.account',
+    'Archive':          'monjour.core.archive',
+    'ArchiveRecord':    'monjour.core.archive',
+    'ArchiveID':        'monjour.core.archive',
+    'Config':           'monjour.core.config',
+    'Importer':         'monjour.core.importer',
+    'DateRange':        'monjour.core.common',
+})
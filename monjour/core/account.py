@@ -1,10 +1,12 @@
-from typing import IO, ClassVar, Self
+from typing import IO, Callable, ClassVar, Self
 import pandas as pd
 
 from monjour.core.log import MjLogger
 from monjour.core.archive import Archive, ArchiveID
+from monjour.core.balance import RunningBalance
 from monjour.core.common import DateRange
 from monjour.core.config import Config
+from monjour.core.dedup import DUPLICATE_OF_COLUMN, DuplicatePolicy, FingerprintIndex, transaction_fingerprints, without_duplicates
 from monjour.core.importer import ImportContext, Importer, ImporterInfo
 from monjour.core.merge import MergeContext, Merger, BoundMerger
 from monjour.core.transaction import Transaction
@@ -34,6 +36,10 @@ class Account:
         importer:   Optional importer to use to import new files into this account. If not provided,
                     the importer will be automatically selected based on the locale.
         merger:     Optional merger to use to merge the account data into the master DataFrame.
+        duplicates: What to do with the transactions of a file that were already merged from another
+                    file covering an overlapping period (see monjour.core.dedup). Defaults to 'drop'.
+        balance:    Running balance of the account, updated when files are merged into it. Starts from
+                    the opening_balance given to __init__ (see monjour.core.balance).
     """
     # Should be overridden by subclasses
     PROVIDER_ID: ClassVar[str] = 'generic'
@@ -47,6 +53,9 @@ class Account:
     locale: str|None
     _importer: Importer|None
     _merger: Merger|None
+    duplicates: DuplicatePolicy
+    _fingerprints: FingerprintIndex
+    balance: RunningBalance
     _initialized: bool = False
 
     # Copy if the arguments is used to copy the account
@@ -63,6 +72,8 @@ class Account:
         locale: str|None = None,
         importer: Importer|None = None,
         merger: Merger|None = None,
+        duplicates: DuplicatePolicy = 'drop',
+        opening_balance: float = 0.0,
         **kwargs
     ):
         self.id = id
@@ -70,12 +81,17 @@ class Account:
         self.locale = locale
         self._importer = importer
         self._merger = merger
+        self.duplicates = duplicates
+        self._fingerprints = FingerprintIndex()
+        self.balance = RunningBalance(opening_balance)
         self.data = self.TRANSACTION_TYPE.to_empty_df()
         if (config := kwargs.get('config')) is not None:
             self.initialize(config)
             self._initialized = True
         if (data := kwargs.get('data')) is not None:
             self.data = data
+            merged = without_duplicates(data)
+            self.balance = RunningBalance.build(merged['date'], merged['amount'], opening_balance)
         self._kwargs = { k: v for k, v in kwargs.items() if k not in ('config', 'data') }
 
     def initialize(self, config: Config):
@@ -133,11 +149,13 @@ class Account:
         The Account class implementing this method is resposible for performing any join or merge operation
         that is necessary to combine the account data with the other DataFrame.
 
+        Transactions flagged as duplicates of another file (see monjour.core.dedup) are not merged.
+
         Args:
             ctx:   MergeContext object containing the accounts to merge.
             other: DataFrame to merge the account data into.
         """
-        return pd.concat([df, self.data], ignore_index=True)
+        return pd.concat([df, without_duplicates(self.data)], ignore_index=True)
 
     def merge_fragment(self, ctx: ImportContext, df: pd.DataFrame):
         """
@@ -151,7 +169,62 @@ class Account:
             ctx: ImportContext object containing the context of the import operation.
             df:  DataFrame containing the transactions imported from the file.
         """
+        df = self.deduplicate_fragment(ctx, df)
         self.data = pd.concat([self.data, df])
+        merged = without_duplicates(df)
+        self.balance = self.balance.insert(merged['date'], merged['amount'])
+
+    def merge_fragments(self, fragments: list[tuple[ImportContext, pd.DataFrame]]):
+        """
+        Merge the transactions of several files at once (bulk imports). Equivalent to calling
+        merge_fragment for each file, but the account's DataFrame is rebuilt only once.
+        Subclasses that override merge_fragment should override this method too.
+
+        Args:
+            fragments: The import context and the transactions of each file.
+        """
+        if len(fragments) > 0:
+            new = pd.concat([self.deduplicate_fragment(ctx, df) for ctx, df in fragments])
+            self.data = pd.concat([self.data, new])
+            merged = without_duplicates(new)
+            self.balance = self.balance.insert(merged['date'], merged['amount'])
+
+    def deduplicate_fragment(self, ctx: ImportContext, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Find the transactions of a file that were already merged into the account from another file
+        with an overlapping date range, and drop or flag them according to the duplicates policy.
+        The number of duplicates is reported as a diagnostic of ctx. A file that was already merged
+        into the account (e.g. imported, then loaded again from the archive) is skipped entirely.
+        Subclasses that override merge_fragment should pass the new transactions through this method.
+
+        Args:
+            ctx: ImportContext of the file.
+            df:  DataFrame containing the transactions imported from the file.
+
+        Returns:
+            The transactions to merge into the account.
+        """
+        if self.duplicates == 'keep':
+            return df
+        if ctx.archive_id in self._fingerprints:
+            ctx.diag_info("Skipped {} transactions, the file was already merged into the account", len(df))
+            return df.iloc[0:0]
+        fingerprints = transaction_fingerprints(df)
+        duplicate_of = self._fingerprints.find_duplicates(ctx.archive_id, ctx.date_range, fingerprints)
+        self._fingerprints.add(ctx.archive_id, ctx.date_range, fingerprints)
+        is_duplicate = pd.notna(duplicate_of)
+        if not is_duplicate.any():
+            return df
+
+        sources = pd.Series(duplicate_of[is_duplicate]).value_counts()
+        summary = ', '.join(f"{count} from {id}" for id, count in sources.items())
+        if self.duplicates == 'drop':
+            ctx.diag_info("Dropped {} transactions already merged from overlapping files ({})",
+                          int(is_duplicate.sum()), summary)
+            return df[~is_duplicate]
+        ctx.diag_info("Flagged {} transactions already merged from overlapping files ({})",
+                      int(is_duplicate.sum()), summary)
+        return df.assign(**{ DUPLICATE_OF_COLUMN: duplicate_of })
 
     ##############################################
     # Importer selection methods
@@ -202,12 +275,7 @@ class Account:
 
         It DOES NOT copy the file into the archive folder. Use archive_file for that.
         """
-        importer = self.importer
-        # Import the file
-        with open(ctx.filename, 'rb') as f:
-            df = importer.import_file(ctx, f)
-            ctx.importer_id = importer.info.id
-            ctx.result = df
+        df = self.parse_file(ctx)
 
         # Register with the archive that we are using an external file
         ctx.archive_operation_result = ctx.archive.register_file(ctx.archive_id, self.id,
@@ -215,6 +283,18 @@ class Account:
         self.merge_fragment(ctx, df)
         return ctx
 
+    def parse_file(self, ctx: ImportContext) -> pd.DataFrame:
+        """
+        Parse a file from the local filesystem with the importer, without registering it in the archive
+        or merging it into the account. The transactions are also stored in ctx.result.
+        """
+        importer = self.importer
+        with open(ctx.filename, 'rb') as f:
+            df = importer.import_file(ctx, f)
+            ctx.importer_id = importer.info.id
+            ctx.result = df
+        return df
+
     def archive_file(self, ctx: ImportContext, buffer: IO[bytes]) -> ImportContext:
         """
         Imports a file from a buffer into this account. This function:
@@ -239,15 +319,27 @@ class Account:
         self.merge_fragment(ctx, df)
         return ctx
 
-    def load_all_from_archive(self, archive: Archive):
+    def load_all_from_archive(self, archive: Archive,
+                              on_file_loaded: Callable[[ArchiveID], None]|None = None) -> list[ImportContext]:
         """
         Load all files previously saved in the archive into the account.
+
+        Args:
+            archive:        Archive object to use for loading the files.
+            on_file_loaded: Optional callback called after each file is loaded (used for progress reporting).
+
+        Returns:
+            The import context of each file (with its diagnostics).
         """
+        contexts = []
         archive_records = archive.get_records_for_account(self.id)
         for record in archive_records:
-            self.load_from_archive(archive, record['id'])
+            contexts.append(self.load_from_archive(archive, record['id']))
+            if on_file_loaded is not None:
+                on_file_loaded(record['id'])
+        return contexts
 
-    def load_from_archive(self, archive: Archive, archive_id: ArchiveID):
+    def load_from_archive(self, archive: Archive, archive_id: ArchiveID) -> ImportContext:
         """
         Load a single file from the archive into the account.
 
@@ -265,6 +357,7 @@ class Account:
         log.info(f"Loaded archived file {archive_id} into account '{self.id}'")
         # Merge the new data into the account
         self.merge_fragment(ctx, df)
+        return ctx
 
     def copy(self) -> "Account":
         """
@@ -272,5 +365,9 @@ class Account:
         - The configuration is copied by reference, as it should be immutable.
         - Any data is copied by value
         """
-        return type(self)(id=self.id, name=self.name, locale=self.locale, importer=self._importer,
-                          merger=self._merger, config=self.config, data=self.data, **self._kwargs)
+        account = type(self)(id=self.id, name=self.name, locale=self.locale, importer=self._importer,
+                             merger=self._merger, config=self.config, data=self.data, **self._kwargs)
+        account.duplicates = self.duplicates
+        account._fingerprints = self._fingerprints.copy()
+        account.balance = self.balance
+        return account
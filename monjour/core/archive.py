@@ -2,11 +2,13 @@ import hashlib
 import io
 import datetime as dt
 import json
+import os
 import pandas as pd
+from contextlib import contextmanager
 from pathlib import Path
 from enum import Enum
 from dataclasses import dataclass
-from typing import IO, TypeAlias, TypedDict, TYPE_CHECKING
+from typing import IO, Iterator, NotRequired, TypeAlias, TypedDict, TYPE_CHECKING
 
 from monjour.core.log import MjLogger
 from monjour.core.common import DateRange
@@ -47,12 +49,16 @@ class ArchiveInfo(TypedDict):
     """
     records: dict[str, ArchiveRecord]
     archiver_version: str
+    # Path of the external files -> (size, mtime_ns, archive id) when they were last registered
+    stat_cache: NotRequired[dict[str, tuple[int, int, str]]]
 
 class ArchiveOperationResult(Enum):
     Error = 0
     Registered = 1
     Archived = 2
     Reimported = 3
+    # The file is already in the archive and didn't change, nothing was done
+    Unchanged = 4
 
 class Archive:
     """
@@ -79,6 +85,12 @@ class Archive:
     archive_json_path: Path
     _df: pd.DataFrame|None
     _check_hashes_on_load: bool
+    # Depth of the nested batch() blocks, and whether a save was deferred by them
+    _batch_depth: int
+    _batch_pending: bool
+    # Path of the external files -> (size, mtime_ns, archive id), see find_by_stat
+    _stat_cache: dict[str, tuple[int, int, ArchiveID]]
+    _loaded: bool
 
     def __init__(self, archive_dir: Path|str, check_hashes_on_load=True):
         if isinstance(archive_dir, str):
@@ -90,6 +102,10 @@ class Archive:
         self.records = {}
         self._df = None
         self._check_hashes_on_load = check_hashes_on_load
+        self._batch_depth = 0
+        self._batch_pending = False
+        self._stat_cache = {}
+        self._loaded = False
 
     @staticmethod
     def calculate_file_hash(buf: IO[bytes]) -> str:
@@ -124,6 +140,37 @@ class Archive:
         """Get the record for the given archive id."""
         return self.records[archive_id]
 
+    def find_by_stat(self, filepath: str) -> ArchiveID|None:
+        """
+        Archive id of an external file if it was registered from the same path and its size and
+        modification time didn't change since, without reading it. None if unknown (or changed).
+        """
+        if (cached := self._stat_cache.get(filepath)) is None:
+            return None
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        size, mtime_ns, archive_id = cached
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns) or archive_id not in self.records:
+            return None
+        return archive_id
+
+    def remember_stat(self, filepath: str, archive_id: ArchiveID) -> bool:
+        """
+        Record the size and modification time of an external file (see find_by_stat). The stat cache is
+        saved with the archive table. Returns True if the cache changed.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        entry = (stat.st_size, stat.st_mtime_ns, archive_id)
+        if self._stat_cache.get(filepath) == entry:
+            return False
+        self._stat_cache[filepath] = entry
+        return True
+
     def ensure_hashes_match(self, archive_id: ArchiveID, hash: str):
         """Ensure the hash of the file matches the hash in the archive table."""
         if hash != self.records[archive_id]['file_hash']:
@@ -227,6 +274,8 @@ class Archive:
             date_end          = date_range.end,
             is_managed_by_archive= is_managed_by_archive,
         )
+        if not is_managed_by_archive:
+            self.remember_stat(filepath, archive_id)
         self.save()
         log.info(f"File registered (archive_id: {archive_id}) (path: {filepath})")
         return ArchiveOperationResult.Registered
@@ -254,6 +303,8 @@ class Archive:
             prev['importer_id'] = importer_id
         prev['imported_date'] = dt.datetime.now()
         prev['file_path'] = filepath
+        if not is_managed_by_archive:
+            self.remember_stat(filepath, archive_id)
 
         self.save()
         log.info(f"File reimported (archive_id: {archive_id}) (path: {filepath})")
@@ -327,10 +378,45 @@ class Archive:
     # Archive metadata management
     ########################################################
 
+    @contextmanager
+    def batch(self) -> Iterator["Archive"]:
+        """
+        Group several operations (e.g. register_file for every file of a bulk import) in a single
+        transaction: the archive table is written once at the end of the block instead of after every
+        operation. If the block raises, the records are restored to their state before the block.
+
+        Example:
+            with archive.batch():
+                for ctx in contexts:
+                    archive.register_file(...)
+        """
+        # Copy of the records to restore if the block fails (records can be modified in place by reimports)
+        records = { id: ArchiveRecord(**record) for id, record in self.records.items() } if self._batch_depth == 0 else None
+        stat_cache = dict(self._stat_cache)
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if records is not None:
+                self.records = records
+                self._stat_cache = stat_cache
+                self._batch_pending = False
+                self._df = None
+            raise
+        finally:
+            self._batch_depth -= 1
+        if self._batch_depth == 0 and self._batch_pending:
+            self._batch_pending = False
+            self.save()
+
     def save(self, filepath: Path|None=None):
         """
-        Save the archive state to disk.
+        Save the archive state to disk. Inside a batch() block the save is deferred to the end of the block.
         """
+        if filepath is None and self._batch_depth > 0:
+            self._batch_pending = True
+            self._df = None
+            return
         # Custom serializer function
         def custom_serializer(obj):
             if isinstance(obj, dt.datetime):
@@ -340,7 +426,8 @@ class Archive:
         path = filepath or self.archive_json_path
         archive_info: ArchiveInfo = {
             'records': self.records,
-            'archiver_version': self.version
+            'archiver_version': self.version,
+            'stat_cache': self._stat_cache,
         }
         path.parent.mkdir(parents=True, exist_ok=True)
         json_str = json.dumps(archive_info, default=custom_serializer, indent=4)
@@ -352,6 +439,7 @@ class Archive:
         Load the archive state from disk.
         """
         path = filepath or self.archive_json_path
+        self._loaded = True
         if not path.exists():
             return
         buf = self._read(path)
@@ -364,6 +452,13 @@ class Archive:
             record['date_start']    = dt.datetime.fromisoformat(record['date_start']) # type: ignore
             record['date_end']      = dt.datetime.fromisoformat(record['date_end']) # type: ignore
         self.records = archive_info['records']
+        self._stat_cache = { path: tuple(entry) for path, entry in archive_info.get('stat_cache', {}).items() } # type: ignore
+        self._df = None
+
+    def ensure_loaded(self):
+        """Load the archive table from disk if it wasn't loaded yet (e.g. imports in configuration.py)."""
+        if not self._loaded:
+            self.load()
 
 
 class InMemoryArchive(Archive):
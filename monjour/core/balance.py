@@ -0,0 +1,97 @@
+"""
+Running balance of the accounts.
+
+Every account keeps the balance after each of its transactions, sorted by date, so that the balance
+of an account at any date is a binary search instead of a sum over its whole history. The balance
+is built once with a cumulative sum and updated incrementally when a file is merged into the account
+(see Account.merge_fragment): the transactions of the file are inserted at their dates and only the
+balances after them are shifted.
+"""
+import numpy as np
+import pandas as pd
+from typing import Any
+
+class RunningBalance:
+    """
+    Immutable, date-sorted running balance of an account. Updates return a new RunningBalance, so
+    that snapshots of the app can share it (see AppSnapshot.account_balances).
+
+    Attributes:
+        opening_balance:    Balance of the account before its first transaction.
+        dates:              Dates of the transactions, sorted (stable: same-date transactions keep
+                            the order they were merged in).
+        balances:           Balance of the account after each transaction, aligned with dates.
+    """
+    opening_balance: float
+    dates: np.ndarray
+    balances: np.ndarray
+
+    def __init__(self, opening_balance: float = 0.0, dates: np.ndarray|None = None, balances: np.ndarray|None = None):
+        self.opening_balance = float(opening_balance)
+        self.dates = np.empty(0, dtype='datetime64[ns]') if dates is None else dates
+        self.balances = np.empty(0, dtype=np.float64) if balances is None else balances
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @staticmethod
+    def _sorted(dates: pd.Series, amounts: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        """Dates and amounts of a frame of transactions, sorted by date. Missing values are skipped."""
+        dates = pd.to_datetime(dates).to_numpy(dtype='datetime64[ns]')
+        amounts = pd.to_numeric(amounts).to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnat(dates) & ~np.isnan(amounts)
+        dates, amounts = dates[valid], amounts[valid]
+        order = np.argsort(dates, kind='stable')
+        return dates[order], amounts[order]
+
+    @staticmethod
+    def build(dates: pd.Series, amounts: pd.Series, opening_balance: float = 0.0) -> "RunningBalance":
+        """Running balance of the transactions with the given dates and amounts."""
+        dates, amounts = RunningBalance._sorted(dates, amounts)
+        return RunningBalance(opening_balance, dates, opening_balance + np.cumsum(amounts))
+
+    def insert(self, dates: pd.Series, amounts: pd.Series) -> "RunningBalance":
+        """
+        Running balance with new transactions inserted. Transactions dated after the last one are
+        appended (O(k)), earlier ones are inserted and shift the balances that follow them (O(n + k)).
+        """
+        new_dates, new_amounts = self._sorted(dates, amounts)
+        if len(new_dates) == 0:
+            return self
+        last = self.balances[-1] if len(self) > 0 else self.opening_balance
+        if len(self) == 0 or new_dates[0] >= self.dates[-1]:
+            return RunningBalance(self.opening_balance, np.concatenate([self.dates, new_dates]),
+                                  np.concatenate([self.balances, last + np.cumsum(new_amounts)]))
+
+        # Each new transaction goes after the existing ones with the same date
+        slots = np.searchsorted(self.dates, new_dates, side='right')
+        inserted = np.concatenate([[0.0], np.cumsum(new_amounts)])
+        # Existing balances grow by the amounts inserted before them
+        before_old = np.searchsorted(slots, np.arange(len(self)), side='right')
+        old_balances = self.balances + inserted[before_old]
+        # New balances: balance of the previous existing transaction plus the amounts inserted up to them
+        previous = np.concatenate([[self.opening_balance], self.balances])[slots]
+        new_balances = previous + inserted[1:]
+
+        positions = slots + np.arange(len(new_dates))
+        merged_dates = np.empty(len(self) + len(new_dates), dtype='datetime64[ns]')
+        merged_balances = np.empty(len(merged_dates), dtype=np.float64)
+        is_new = np.zeros(len(merged_dates), dtype=bool)
+        is_new[positions] = True
+        merged_dates[is_new], merged_balances[is_new] = new_dates, new_balances
+        merged_dates[~is_new], merged_balances[~is_new] = self.dates, old_balances
+        return RunningBalance(self.opening_balance, merged_dates, merged_balances)
+
+    def at(self, date: Any) -> float:
+        """Balance after the transactions dated up to the given date/time, included (binary search)."""
+        position = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date), 'ns'), side='right')
+        return float(self.balances[position - 1]) if position > 0 else self.opening_balance
+
+    @property
+    def current(self) -> float:
+        """Balance after the last transaction."""
+        return float(self.balances[-1]) if len(self) > 0 else self.opening_balance
+
+    def to_df(self) -> pd.DataFrame:
+        """The running balance as a DataFrame with the columns 'date' and 'balance'."""
+        return pd.DataFrame({ 'date': self.dates, 'balance': self.balances })
@@ -1,9 +1,265 @@
-from typing import Self
+import numpy as np
+import pandas as pd
+from typing import Iterable, Self
+
+from monjour.core.common import floor_dates
+
+CATEGORY_SEPARATOR = '/'
 
 class Category:
+    """
+    A category of transactions. Categories can be nested either by using the separator in the
+    name (for example 'Expenses/Food') or by passing the subcategories in children.
+
+    Attributes:
+        name:       Name of the category. For subcategories passed in children this is the name
+                    relative to the parent category.
+        emoji:      Optional emoji to display next to the category.
+        children:   Subcategories.
+    """
     name: str
     emoji: str|None
+    children: list["Category"]
 
     def __init__(self, name, emoji: str|None = None, children: list[str]|list[Self] = []):
         self.name = name
         self.emoji = emoji
+        self.children = [c if isinstance(c, Category) else Category(c) for c in children]
+
+    def __repr__(self) -> str:
+        return f"Category({self.name})"
+
+    def flatten(self, parent: str|None = None) -> list["Category"]:
+        """
+        Return this category and all its subcategories (recursively) as a flat list of
+        categories named with their full path.
+        """
+        name = self.name if parent is None else parent + CATEGORY_SEPARATOR + self.name
+        result = [Category(name, self.emoji)]
+        for child in self.children:
+            result.extend(child.flatten(name))
+        return result
+
+class CategoryTree:
+    """
+    Tree of all the categories known to the app. Every category path (for example 'Expenses/Food')
+    is a node, and all its prefixes ('Expenses') are nodes too.
+
+    Nodes are identified by integer ids and hold a pointer to their parent, so that aggregations
+    can be computed on integer codes and rolled up the tree with vectorized operations instead
+    of splitting category strings.
+
+    Attributes:
+        names:      Full path of each node.
+        labels:     Last component of the path of each node.
+        parents:    Id of the parent of each node (-1 for top-level nodes).
+        depths:     Depth of each node (0 for top-level nodes).
+        emojis:     Emoji of each node.
+        ids:        Map from full path to node id.
+    """
+    names: list[str]
+    labels: list[str]
+    parents: list[int]
+    depths: list[int]
+    emojis: list[str|None]
+    ids: dict[str, int]
+
+    # Cached (n_nodes, max_depth + 1) matrix of the ancestors of each node (self included)
+    _ancestors: np.ndarray|None
+
+    def __init__(self, categories: Iterable[Category]|None = None):
+        self.names = []
+        self.labels = []
+        self.parents = []
+        self.depths = []
+        self.emojis = []
+        self.ids = {}
+        self._ancestors = None
+        for category in categories or []:
+            self.add_category(category)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def copy(self) -> "CategoryTree":
+        tree = CategoryTree()
+        tree.names = self.names.copy()
+        tree.labels = self.labels.copy()
+        tree.parents = self.parents.copy()
+        tree.depths = self.depths.copy()
+        tree.emojis = self.emojis.copy()
+        tree.ids = self.ids.copy()
+        tree._ancestors = self._ancestors
+        return tree
+
+    ##############################################
+    # Construction
+    ##############################################
+
+    def add(self, name: str, emoji: str|None = None) -> int:
+        """Add a node (and all its missing ancestors) to the tree. Returns the id of the node."""
+        if (id := self.ids.get(name)) is not None:
+            if emoji is not None:
+                self.emojis[id] = emoji
+            return id
+        parent = -1
+        depth = 0
+        if CATEGORY_SEPARATOR in name:
+            parent_name, label = name.rsplit(CATEGORY_SEPARATOR, 1)
+            parent = self.add(parent_name)
+            depth = self.depths[parent] + 1
+        else:
+            label = name
+        id = len(self.names)
+        self.names.append(name)
+        self.labels.append(label)
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.emojis.append(emoji)
+        self.ids[name] = id
+        self._ancestors = None
+        return id
+
+    def add_category(self, category: Category):
+        """Add a category and all its subcategories to the tree."""
+        for c in category.flatten():
+            self.add(c.name, c.emoji)
+
+    def extend(self, categories: pd.Series):
+        """Add all the (distinct) categories found in a column of categories."""
+        for name in pd.unique(categories.dropna()):
+            if name not in self.ids:
+                self.add(str(name))
+
+    ##############################################
+    # Queries
+    ##############################################
+
+    def encode(self, categories: pd.Series) -> np.ndarray:
+        """
+        Map a column of category names to node ids. Missing or unknown categories map to -1.
+        The lookup is done once per distinct value.
+        """
+        codes, uniques = pd.factorize(categories)
+        unique_ids = np.fromiter((self.ids.get(u, -1) for u in uniques), dtype=np.int64, count=len(uniques))
+        return np.where(codes >= 0, unique_ids[codes] if len(uniques) else -1, -1)
+
+    def children(self, id: int) -> list[int]:
+        """Ids of the direct children of a node. Use -1 to get the top-level nodes."""
+        return [i for i, p in enumerate(self.parents) if p == id]
+
+    def top_level(self, id: int) -> int:
+        """Id of the top-level ancestor of a node (e.g. 'Expenses' for 'Expenses/Food/Restaurants')."""
+        while self.parents[id] != -1:
+            id = self.parents[id]
+        return id
+
+    def ancestors(self) -> np.ndarray:
+        """
+        Matrix of shape (n_nodes, max_depth + 1). Row i contains i, its parent, its grandparent, ...
+        padded with -1.
+        """
+        if self._ancestors is None:
+            n = len(self.names)
+            width = max(self.depths, default=0) + 1
+            ancestors = np.full((n, width), -1, dtype=np.int64)
+            parents = np.array(self.parents, dtype=np.int64)
+            current = np.arange(n, dtype=np.int64)
+            for level in range(width):
+                ancestors[:, level] = current
+                current = np.where(current >= 0, parents[np.maximum(current, 0)], -1)
+            self._ancestors = ancestors
+        return self._ancestors
+
+    def paths(self, categories: pd.Series) -> pd.DataFrame:
+        """
+        Expand a column of category names to their paths in the tree: column d holds the name of the
+        ancestor at depth d (e.g. 'Expenses', 'Expenses/Food', 'Expenses/Food/Restaurants').
+        Columns deeper than the category are missing, and so are all the columns of unknown categories.
+        """
+        if len(self) == 0:
+            return pd.DataFrame({0: pd.Series(None, index=categories.index, dtype=object)})
+        ids = self.encode(categories)
+        known = ids >= 0
+        ids = np.maximum(ids, 0)
+        depths = np.array(self.depths, dtype=np.int64)[ids]
+        # Row i of the ancestors starts at the node itself, so the ancestor at depth d is at column depth - d
+        levels = np.arange(max(self.depths) + 1)
+        columns = np.maximum(depths[:, None] - levels[None, :], 0)
+        paths = np.take_along_axis(self.ancestors()[ids], columns, axis=1)
+        paths = np.where(known[:, None] & (levels[None, :] <= depths[:, None]), paths, -1)
+        names = np.array(self.names + [None], dtype=object)
+        return pd.DataFrame(names[paths], index=categories.index)
+
+    def relative_name(self, id: int) -> str:
+        """Name of a node relative to its top-level ancestor (e.g. 'Food/Restaurants')."""
+        return self.names[id].split(CATEGORY_SEPARATOR, 1)[-1]
+
+    def to_df(self) -> pd.DataFrame:
+        """Return the nodes of the tree as a DataFrame indexed by node id."""
+        n = len(self.names)
+        has_children = np.zeros(n, dtype=bool)
+        parents = np.array(self.parents, dtype=np.int64)
+        has_children[parents[parents >= 0]] = True
+        return pd.DataFrame({
+            'name': self.names,
+            'label': self.labels,
+            'relative_name': [self.relative_name(i) for i in range(n)],
+            'parent': self.parents,
+            'depth': self.depths,
+            'top_level': [self.top_level(i) for i in range(n)],
+            'emoji': self.emojis,
+            'is_leaf': ~has_children,
+        }).rename_axis('node_id')
+
+    ##############################################
+    # Aggregations
+    ##############################################
+
+    def totals(self, df: pd.DataFrame, freq: str|None = None) -> pd.DataFrame:
+        """
+        Compute the total amount and the number of transactions assigned to every node of the tree,
+        excluding its descendants (see rollup). Takes the same arguments and returns the same columns
+        of rollup.
+        """
+        keys = ['node_id'] if freq is None else ['node_id', 'period']
+        node_ids = self.encode(df['category'])
+        valid = node_ids >= 0
+        own = pd.DataFrame({
+            'node_id': node_ids[valid],
+            'amount': df['amount'].to_numpy()[valid],
+            'count': df['count'].to_numpy()[valid] if 'count' in df.columns else 1,
+        })
+        if freq is not None:
+            own['period'] = floor_dates(df['date'], freq).to_numpy()[valid]
+        return own.groupby(keys, as_index=False, sort=False).sum()
+
+    def rollup(self, df: pd.DataFrame, freq: str|None = None) -> pd.DataFrame:
+        """
+        Compute the total amount and the number of transactions of every node of the tree.
+        The totals of a node include the transactions of all its descendants.
+
+        Args:
+            df:     DataFrame of transactions (with the 'category', 'amount' and 'date' columns).
+                    If df has a 'count' column (e.g. the rows of an AggregateCube) it is used as the
+                    number of transactions of each row.
+            freq:   Optional time bucket ('day', 'week', 'month', 'year'). If set, the totals are also
+                    split by period and the result has a 'period' column with the start of the period.
+
+        Returns:
+            DataFrame with the columns node_id, [period], amount, count. Nodes without transactions are omitted.
+        """
+        keys = ['node_id'] if freq is None else ['node_id', 'period']
+        own = self.totals(df, freq)
+
+        # Add the totals of every node to all its ancestors
+        ancestors = self.ancestors()[own['node_id'].to_numpy()]
+        rows = np.repeat(np.arange(len(own)), ancestors.shape[1])
+        node_ids = ancestors.ravel()
+        keep = node_ids >= 0
+        expanded = own.iloc[rows[keep]].reset_index(drop=True)
+        expanded['node_id'] = node_ids[keep]
+        return expanded.groupby(keys, as_index=False).sum()[[*keys, 'amount', 'count']]
@@ -58,6 +58,12 @@ class DateRange:
             end=dt.datetime.combine(dt.datetime.strptime(end, '%Y-%m-%d'), dt.time.max)
         )
 
+    def overlaps(self, other: "DateRange") -> bool:
+        """
+        True if the two periods share at least one instant (both ends are inclusive).
+        """
+        return self.start <= other.end and other.start <= self.end
+
 def try_infer_daterange_from_filename(filename: str) -> DateRange|None:
     """
     Try to infer the date range from the filename.
@@ -78,4 +84,33 @@ def try_infer_daterange_from_filename(filename: str) -> DateRange|None:
         return None
     start = dt.datetime.strptime(matches[0], '%Y-%m-%d')
     end = dt.datetime.combine(dt.datetime.strptime(matches[1], '%Y-%m-%d'), dt.time.max)
-    return DateRange(start=start, end=end)
\ No newline at end of file
+    return DateRange(start=start, end=end)
+
+# Time buckets used to group transactions in reports. Weeks start on monday
+TIME_BUCKETS = ['day', 'week', 'month', 'year']
+
+def floor_dates(dates: pd.Series, bucket: str) -> pd.Series:
+    """
+    Floor dates to the start of their day, week, month or year.
+    Vectorized equivalent of dates.dt.to_period(freq).apply(lambda p: p.start_time).
+
+    Args:
+        dates:  Series of datetimes.
+        bucket: One of TIME_BUCKETS.
+    """
+    day = dates.dt.normalize()
+    if bucket == 'day':
+        return day
+    elif bucket == 'week':
+        offset = day.dt.dayofweek
+    elif bucket == 'month':
+        offset = day.dt.day - 1
+    elif bucket == 'year':
+        offset = day.dt.dayofyear - 1
+    else:
+        raise ValueError(f"Unknown time bucket '{bucket}'. Expected one of {TIME_BUCKETS}")
+    return day - pd.to_timedelta(offset, unit='D')
+
+def time_buckets(dates: pd.Series) -> pd.DataFrame:
+    """Compute all the TIME_BUCKETS columns for a Series of datetimes. The result has the index of dates."""
+    return pd.DataFrame({ bucket: floor_dates(dates, bucket) for bucket in TIME_BUCKETS }, index=dates.index)
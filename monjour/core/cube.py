@@ -0,0 +1,187 @@
+"""
+Materialized aggregates of the master account.
+
+The report pages mostly need sums and counts per period, so instead of grouping the whole master
+DataFrame on every render they query an AggregateCube: a small table with one row per
+(day, account, category, currency, sign) that is built after the merge and rolled up to
+weeks, months or years on demand.
+"""
+import numpy as np
+import pandas as pd
+from typing import Hashable
+
+from monjour.core.common import floor_dates
+from monjour.core.fx import AMOUNT_BASE_COLUMN
+from monjour.core.transaction import PaymentType
+
+# Key columns of the cube. 'date' is the day of the transactions, 'expense' is True for negative amounts
+# (see expense_flags)
+CUBE_DIMENSIONS = ['date', 'account_id', 'category', 'currency', 'expense']
+CUBE_MEASURES = ['amount', 'count']
+
+def expense_flags(df: pd.DataFrame) -> pd.Series:
+    """
+    True for the expenses (negative amounts), False for the income and missing for the internal
+    transfers, that only move money between the accounts and are neither.
+    """
+    expense = pd.Series(df['amount'] < 0, index=df.index, dtype='boolean')
+    if 'payment_type' in df.columns:
+        expense[(df['payment_type'] == PaymentType.InternalTransfer.value).fillna(False).to_numpy(dtype=bool)] = pd.NA
+    return expense
+
+class AggregateCube:
+    """
+    Sums and counts of the transactions of the master account at day granularity, keyed by
+    account, category, currency and sign (expense/income).
+
+    Since expenses and income are kept in separate cells, the absolute value of a cell is also the
+    sum of the absolute values of its transactions.
+
+    Amounts are in the reporting currency when the master account has an 'amount_base' column
+    (see App.define_fx_rates), in the currency of each transaction otherwise.
+
+    The cube is maintained by App after every merge. Each account slice remembers the signature of
+    the data it was computed from, so that after an import only the slices of the accounts that
+    changed are recomputed. The signatures include the digest of the merged rows of the account
+    (see digests), since the merge stages can rewrite the transactions of any account.
+
+    Attributes:
+        df:             The cube, sorted by date. Columns: CUBE_DIMENSIONS + CUBE_MEASURES.
+        signatures:     Signature of the account data each slice was computed from.
+        generation:     Generation of the merge configuration the cube was computed with (see App).
+    """
+    df: pd.DataFrame
+    signatures: dict[str, Hashable]
+    generation: int
+
+    def __init__(self):
+        self.df = self.aggregate(pd.DataFrame())
+        self.signatures = {}
+        self.generation = -1
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    ##############################################
+    # Maintenance
+    ##############################################
+
+    @staticmethod
+    def digests(df: pd.DataFrame) -> dict[str, int]:
+        """
+        Digest of the cube inputs of each account of the master account: the sum (modulo 2^64) of
+        the hashes of the date, category, currency, sign and amount of its transactions. Changes
+        whenever a merge stage rewrites a transaction of the account (e.g. its category or payment
+        type), even if the files of the account didn't change.
+        """
+        if len(df) == 0 or 'date' not in df.columns or 'account_id' not in df.columns:
+            return {}
+        missing = pd.Series(pd.NA, index=df.index, dtype='string')
+        hashes = pd.util.hash_pandas_object(pd.DataFrame({
+            'date': df['date'],
+            'category': df['category'] if 'category' in df.columns else missing,
+            'currency': df['currency'] if 'currency' in df.columns else missing,
+            'expense': expense_flags(df),
+            'amount': df[AMOUNT_BASE_COLUMN] if AMOUNT_BASE_COLUMN in df.columns else df['amount'],
+        }), index=False).to_numpy()
+        # Sum the hashes of each account (uint64 sums wrap around)
+        codes, accounts = pd.factorize(df['account_id'], use_na_sentinel=False)
+        order = np.argsort(codes, kind='stable')
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+        return { str(account): int(digest) for account, digest in zip(accounts, np.add.reduceat(hashes[order], starts)) }
+
+    @staticmethod
+    def aggregate(df: pd.DataFrame) -> pd.DataFrame:
+        """Aggregate a DataFrame of transactions into cube rows."""
+        if len(df) == 0 or 'date' not in df.columns:
+            return pd.DataFrame({
+                'date': pd.Series(dtype='datetime64[ns]'),
+                'account_id': pd.Series(dtype='string'),
+                'category': pd.Series(dtype='string'),
+                'currency': pd.Series(dtype='string'),
+                'expense': pd.Series(dtype='boolean'),
+                'amount': pd.Series(dtype=float),
+                'count': pd.Series(dtype=np.int64),
+            })
+        missing = pd.Series(pd.NA, index=df.index, dtype='string')
+        cells = pd.DataFrame({
+            'date': df['date'].dt.normalize(),
+            'account_id': df['account_id'] if 'account_id' in df.columns else missing,
+            'category': df['category'] if 'category' in df.columns else missing,
+            'currency': df['currency'] if 'currency' in df.columns else missing,
+            'expense': expense_flags(df),
+            # Amounts in the reporting currency, if the master account was normalized (see monjour.core.fx)
+            'amount': df[AMOUNT_BASE_COLUMN] if AMOUNT_BASE_COLUMN in df.columns else df['amount'],
+            'count': np.ones(len(df), dtype=np.int64),
+        })
+        return cells.groupby(CUBE_DIMENSIONS, as_index=False, dropna=False, observed=True, sort=False).sum()
+
+    def build(self, df: pd.DataFrame, signatures: dict[str, Hashable], generation: int):
+        """Rebuild the whole cube from the master account."""
+        self.df = self.aggregate(df).sort_values('date', kind='stable', ignore_index=True)
+        self.signatures = dict(signatures)
+        self.generation = generation
+
+    def update(self, df: pd.DataFrame, signatures: dict[str, Hashable], generation: int) -> list[str]:
+        """
+        Bring the cube up to date with the master account, recomputing only the slices of the
+        accounts whose signature changed. Falls back to a full rebuild if the merge configuration
+        changed since the cube was built.
+
+        Args:
+            df:             The master account.
+            signatures:     Signature of the data of each merged account.
+            generation:     Generation of the merge configuration.
+
+        Returns:
+            The IDs of the accounts whose slices were recomputed.
+        """
+        if generation != self.generation:
+            self.build(df, signatures, generation)
+            return list(signatures.keys())
+        stale = [id for id, signature in signatures.items() if self.signatures.get(id, None) != signature]
+        removed = [id for id in self.signatures.keys() if id not in signatures]
+        if len(stale) == 0 and len(removed) == 0:
+            return []
+        keep = self.df[~self.df['account_id'].isin(stale + removed)]
+        fresh = self.aggregate(df[df['account_id'].isin(stale)])
+        self.df = pd.concat([keep, fresh], ignore_index=True).sort_values('date', kind='stable', ignore_index=True)
+        self.signatures = dict(signatures)
+        return stale
+
+    def copy(self) -> "AggregateCube":
+        cube = AggregateCube()
+        cube.df = self.df
+        cube.signatures = self.signatures.copy()
+        cube.generation = self.generation
+        return cube
+
+    ##############################################
+    # Queries
+    ##############################################
+
+    def rollup(self, freq: str = 'month', by: list[str] = [], df: pd.DataFrame|None = None) -> pd.DataFrame:
+        """
+        Roll the cube up to a coarser period.
+
+        Args:
+            freq:   One of TIME_BUCKETS ('day', 'week', 'month', 'year').
+            by:     Other dimensions to keep (e.g. ['expense'] or ['account_id', 'category']).
+            df:     Optional subset of the cube rows (e.g. filtered by date). Defaults to the whole cube.
+
+        Returns:
+            DataFrame with the columns <freq> (start of the period), *by, amount, count.
+        """
+        df = self.df if df is None else df
+        period = floor_dates(df['date'], freq)
+        return (
+            df[[*by, *CUBE_MEASURES]]
+            .assign(**{freq: period})
+            .groupby([freq, *by], as_index=False, dropna=False, observed=True)
+            [CUBE_MEASURES].sum()
+        )
+
+    def totals(self, by: list[str], df: pd.DataFrame|None = None) -> pd.DataFrame:
+        """Total amount and count over the whole period, grouped by the given dimensions."""
+        df = self.df if df is None else df
+        return df.groupby(by, as_index=False, dropna=False, observed=True)[CUBE_MEASURES].sum()
@@ -0,0 +1,124 @@
+"""
+Fingerprints of transactions, used to detect the transactions imported twice from overlapping files
+and as stable transaction IDs (see transaction_ids).
+
+Bank exports often overlap (e.g. a monthly and a yearly statement of the same account) and every
+file has its own archive ID, so the same transactions would be counted once per file. Every
+transaction gets a fingerprint: a 64 bit hash of its account, day, amount (to the cent), normalized
+description and its occurrence number among the transactions of its file with the same values.
+
+The occurrence number keeps genuine repeats apart (e.g. two identical coffees on the same day):
+if the monthly file has two of them and the yearly file has two, both copies of the yearly file are
+duplicates, if the yearly file has three, the third one is a new transaction.
+"""
+import numpy as np
+import pandas as pd
+from typing import Literal
+
+from monjour.core.archive import ArchiveID
+from monjour.core.common import DateRange
+
+# What Account.merge_fragment does with the transactions already merged from another file:
+# 'drop' them, 'flag' them (see DUPLICATE_OF_COLUMN) or 'keep' them as they are.
+# Flagged transactions stay in the data of the account but are left out of its balance and of the
+# master account (see without_duplicates).
+DuplicatePolicy = Literal['drop', 'flag', 'keep']
+
+# Column holding, for flagged duplicates, the archive ID of the file the transaction was first merged from
+DUPLICATE_OF_COLUMN = 'duplicate_of'
+
+def without_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The transactions of an account that are not flagged as duplicates (see DUPLICATE_OF_COLUMN).
+    Mergers should merge these into the master account instead of the whole data of the account.
+    """
+    if DUPLICATE_OF_COLUMN not in df.columns:
+        return df
+    return df[df[DUPLICATE_OF_COLUMN].isna().to_numpy(dtype=bool)]
+
+def transaction_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """
+    Fingerprint (uint64) of every transaction of a file, in order. Missing columns hash as missing values.
+    """
+    if len(df) == 0:
+        return np.empty(0, dtype=np.uint64)
+    missing = pd.Series(pd.NA, index=df.index, dtype=object)
+    accounts = (df['account_id'] if 'account_id' in df.columns else missing).astype('string').fillna('')
+    dates = pd.to_datetime(df['date'] if 'date' in df.columns else missing).dt.normalize()
+    amounts = pd.to_numeric(df['amount'] if 'amount' in df.columns else missing).round(2)
+    # Descriptions repeat a lot, normalize each distinct value once
+    codes, uniques = pd.factorize(df['desc'] if 'desc' in df.columns else missing)
+    uniques = pd.Series(uniques, dtype='string').str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+    descs = np.append(uniques.to_numpy(dtype=object, na_value=''), '')[codes]
+    keys = pd.DataFrame({
+        'account_id': accounts.to_numpy(dtype=object),
+        'date': dates.to_numpy(),
+        'amount': amounts.to_numpy(dtype=np.float64),
+        'desc': descs,
+    })
+    base = pd.util.hash_pandas_object(keys, index=False)
+    occurrence = base.groupby(base, sort=False).cumcount()
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        'key': base.to_numpy(),
+        'occurrence': occurrence.to_numpy(),
+    }), index=False).to_numpy()
+
+def transaction_ids(df: pd.DataFrame) -> pd.Series:
+    """
+    Stable ID (TransactionID) of every transaction of a frame, e.g. the master account: '<account_id>:<fingerprint>'.
+    The ID doesn't depend on the file the transaction was imported from nor on its position, so it
+    survives re-imports and is used by the links between transactions (e.g. Transaction.ref).
+    """
+    if len(df) == 0:
+        return pd.Series([], index=df.index, dtype='string')
+    # Format the fingerprints as 16 hex digits without a python loop
+    fingerprints = transaction_fingerprints(df)
+    nibbles = (fingerprints[:, None] >> np.arange(60, -4, -4).astype(np.uint64)) & np.uint64(0xF)
+    digits = np.frombuffer(b'0123456789abcdef', dtype='S1')[nibbles.astype(np.intp)]
+    accounts = df['account_id'].astype('string').fillna('') if 'account_id' in df.columns else ''
+    return accounts + ':' + pd.Series(digits.view('S16').ravel().astype(str), index=df.index)
+
+class FingerprintIndex:
+    """
+    Fingerprints of the transactions merged into an account, by file. A new file is only compared
+    with the files whose date range overlaps its own, with a hash lookup (O(n) in the number of
+    transactions of the compared files).
+    """
+    # archive_id -> (date range of the file, fingerprints of all its transactions)
+    _files: dict[ArchiveID, tuple[DateRange, np.ndarray]]
+
+    def __init__(self):
+        self._files = {}
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, archive_id: ArchiveID) -> bool:
+        return archive_id in self._files
+
+    def add(self, archive_id: ArchiveID, date_range: DateRange, fingerprints: np.ndarray):
+        """Remember the fingerprints of a merged file. A file merged again keeps its first fingerprints."""
+        self._files.setdefault(archive_id, (date_range, fingerprints))
+
+    def find_duplicates(self, archive_id: ArchiveID, date_range: DateRange, fingerprints: np.ndarray) -> np.ndarray:
+        """
+        For every fingerprint of a new file, the archive ID of the first other overlapping file that
+        already contains it, or None. The file itself is never compared with its own fingerprints.
+        """
+        result = np.full(len(fingerprints), None, dtype=object)
+        overlapping = [(id, fps) for id, (r, fps) in self._files.items()
+                       if id != archive_id and r.overlaps(date_range)]
+        if len(overlapping) == 0 or len(fingerprints) == 0:
+            return result
+        known = pd.Index(np.concatenate([fps for _, fps in overlapping]))
+        owners = np.concatenate([np.full(len(fps), id, dtype=object) for id, fps in overlapping])
+        first = ~known.duplicated()
+        positions = known[first].get_indexer(fingerprints)
+        found = positions >= 0
+        result[found] = owners[first][positions[found]]
+        return result
+
+    def copy(self) -> "FingerprintIndex":
+        index = FingerprintIndex()
+        index._files = self._files.copy()
+        return index
@@ -0,0 +1,159 @@
+"""
+Indexes over the columns of a DataFrame, used to filter the master account without scanning it.
+
+Filters return the (sorted) positions of the matching rows instead of boolean masks, so that
+several filters can be combined with set intersections and only the matching rows are materialized.
+"""
+import re
+import numpy as np
+import pandas as pd
+from typing import Any, Iterable
+
+from monjour.utils.trigram_index import TrigramIndex
+
+# Free-text columns of the master account that get a trigram index (see FrameIndex.text_index)
+TEXT_SEARCH_COLUMNS = ['desc', 'counterpart', 'location', 'notes']
+
+# Characters that make a regex pattern more than a literal substring
+REGEX_METACHARACTERS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+class FrameIndex:
+    """
+    Lazily built per-column indexes of a DataFrame:
+    - Sorted indexes (sorted values and their positions), for range filters (binary search).
+    - Value indexes (distinct values and the positions of the rows of each value), for equality filters.
+    - Trigram indexes over the distinct values of text columns, for substring searches.
+
+    The index of a column is built the first time the column is filtered, and the whole FrameIndex is
+    meant to be built once per version of the frame (see AppSnapshot.index).
+
+    Attributes:
+        df:         The indexed frame. Must not be modified.
+        version:    Version of the frame (e.g. App.df_version).
+    """
+    df: pd.DataFrame
+    version: int|None
+
+    # column -> (sorted non-missing values, their positions)
+    _sorted: dict[str, tuple[pd.Index, np.ndarray]]
+    # column -> (distinct values, positions grouped by value, offsets of each group)
+    # The group of the missing values is the last one
+    _values: dict[str, tuple[pd.Index, np.ndarray, np.ndarray]]
+    # column -> trigram index of the distinct values of the column
+    _text: dict[str, TrigramIndex]
+
+    def __init__(self, df: pd.DataFrame, version: int|None = None):
+        self.df = df
+        self.version = version
+        self._sorted = {}
+        self._values = {}
+        self._text = {}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    ##############################################
+    # Indexes
+    ##############################################
+
+    def sorted_index(self, column: str) -> tuple[pd.Index, np.ndarray]:
+        """The non-missing values of a column, sorted, and the positions of their rows."""
+        if column not in self._sorted:
+            series = self.df[column]
+            positions = np.flatnonzero(series.notna().to_numpy())
+            values = pd.Index(series.iloc[positions])
+            order = values.argsort(kind='stable')
+            self._sorted[column] = (values[order], positions[order])
+        return self._sorted[column]
+
+    def value_index(self, column: str) -> tuple[pd.Index, np.ndarray, np.ndarray]:
+        """The distinct values of a column and the positions of the rows of each value."""
+        if column not in self._values:
+            codes, uniques = pd.factorize(self.df[column])
+            # Missing values (code -1) go in the last group
+            codes = np.where(codes >= 0, codes, len(uniques))
+            grouped = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes, minlength=len(uniques) + 1)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._values[column] = (pd.Index(uniques), grouped, offsets)
+        return self._values[column]
+
+    def text_index(self, column: str) -> TrigramIndex:
+        """Trigram index of the distinct values of a column (ids are the codes of the value index)."""
+        if column not in self._text:
+            uniques, _, _ = self.value_index(column)
+            self._text[column] = TrigramIndex(uniques.astype(str))
+        return self._text[column]
+
+    def build_text_indexes(self, columns: list[str] = TEXT_SEARCH_COLUMNS):
+        """Build the trigram indexes of the given columns ahead of the first search."""
+        for column in columns:
+            if column in self.df.columns:
+                self.text_index(column)
+
+    def uniques(self, column: str) -> list[Any]:
+        """Distinct values of a column (missing values excluded)."""
+        return list(self.value_index(column)[0])
+
+    ##############################################
+    # Filters
+    ##############################################
+
+    def range(self, column: str, start: Any = None, end: Any = None) -> np.ndarray:
+        """Positions of the rows with start <= value <= end. Missing values never match."""
+        values, positions = self.sorted_index(column)
+        lo = 0 if start is None else values.searchsorted(start, side='left')
+        hi = len(values) if end is None else values.searchsorted(end, side='right')
+        return np.sort(positions[lo:hi])
+
+    def isin(self, column: str, values: Iterable[Any]) -> np.ndarray:
+        """Positions of the rows whose value is one of values. Missing values match if values contains one."""
+        uniques, grouped, offsets = self.value_index(column)
+        values = list(values)
+        codes = [c for c in uniques.get_indexer([v for v in values if not pd.isna(v)]) if c >= 0]
+        if any(pd.isna(v) for v in values):
+            codes.append(len(uniques))
+        return self._positions_of_codes(np.asarray(codes, dtype=np.int64), grouped, offsets)
+
+    def contains(self, column: str, pattern: str, case: bool = False, regex: bool = True) -> np.ndarray:
+        """
+        Positions of the rows whose value contains pattern (like Series.str.contains).
+        The pattern is evaluated once per distinct value. Literal patterns on TEXT_SEARCH_COLUMNS (or on
+        columns whose trigram index was already built) are only verified on the values that contain all
+        the trigrams of the pattern.
+        """
+        uniques, grouped, offsets = self.value_index(column)
+        candidates = None
+        is_literal = not regex or REGEX_METACHARACTERS.search(pattern) is None
+        if is_literal and (column in TEXT_SEARCH_COLUMNS or column in self._text):
+            candidates = self.text_index(column).candidates(pattern)
+        if candidates is None:
+            candidates = np.arange(len(uniques))
+        values = pd.Series(uniques[candidates].astype(str), dtype='string')
+        hits = values.str.contains(pattern, case=case, regex=regex and not is_literal)
+        codes = candidates[hits.fillna(False).to_numpy(dtype=bool)]
+        return self._positions_of_codes(codes, grouped, offsets)
+
+    ##############################################
+    # Combination
+    ##############################################
+
+    @staticmethod
+    def intersect(a: np.ndarray|None, b: np.ndarray) -> np.ndarray:
+        """Intersection of two sorted arrays of positions. None means all the rows."""
+        if a is None:
+            return b
+        return np.intersect1d(a, b, assume_unique=True)
+
+    def take(self, positions: np.ndarray|None) -> pd.DataFrame:
+        """The rows at the given positions. None means all the rows."""
+        if positions is None:
+            return self.df
+        return self.df.iloc[positions]
+
+    @staticmethod
+    def _positions_of_codes(codes: np.ndarray, grouped: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int64)
+        parts = [grouped[offsets[c]:offsets[c + 1]] for c in codes]
+        return np.sort(np.concatenate(parts))
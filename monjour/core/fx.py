@@ -0,0 +1,140 @@
+"""
+Conversion of the transactions to the reporting currency (Config.currency).
+
+Accounts can hold transactions in several currencies (e.g. a PayPal account), so summing 'amount'
+mixes them. The CurrencyNormalizer merge stage adds an 'amount_base' column with the amount of
+every transaction in the reporting currency, using the last known exchange rate of its currency
+at the date of the transaction. The aggregates (see monjour.core.cube) are computed on amount_base.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from monjour.core.log import MjLogger
+from monjour.core.merge import MergeContext, Merger
+
+log = MjLogger(__name__)
+
+# Column holding the amount of the transactions in the reporting currency
+AMOUNT_BASE_COLUMN = 'amount_base'
+
+class FxRates:
+    """
+    Exchange rates to the reporting currency over time.
+
+    Attributes:
+        base:   The reporting currency.
+        df:     One row per (date, currency): 'rate' is the value, in the base currency, of one
+                unit of the currency from that date on. Sorted by date.
+    """
+    base: str
+    df: pd.DataFrame
+
+    def __init__(self, df: pd.DataFrame, base: str):
+        self.base = base
+        self.df = pd.DataFrame({
+            'date': pd.to_datetime(df['date']).astype('datetime64[ns]'),
+            'currency': df['currency'].astype(str).to_numpy(dtype=object),
+            'rate': df['rate'].astype(np.float64),
+        }).dropna().sort_values('date', kind='stable', ignore_index=True)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @staticmethod
+    def load(path: str|Path, base: str) -> "FxRates":
+        """
+        Load a rate table from a CSV or Parquet file with the columns 'date', 'currency' and 'rate'.
+
+        The table can also hold currency pairs, with a 'base' column: rows quoted in the reporting
+        currency are used as they are, rows quoting the reporting currency in another one are
+        inverted, the others are ignored.
+        """
+        path = Path(path)
+        if path.suffix.lower() == '.parquet':
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+        if 'base' in df.columns:
+            direct = df[df['base'] == base]
+            inverse = df[df['currency'] == base]
+            df = pd.concat([
+                direct,
+                inverse.assign(currency=inverse['base'], rate=1 / inverse['rate']),
+            ], ignore_index=True)
+        rates = FxRates(df, base)
+        log.info(f"Loaded {len(rates)} exchange rates to {base} for {rates.df['currency'].nunique()} currencies from {path}")
+        return rates
+
+    def convert(self, amounts: pd.Series, currencies: pd.Series, dates: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Convert amounts to the base currency with the last rate known at their date (as-of join per
+        currency). Amounts dated before the first rate of their currency use the first rate.
+        Amounts without a currency are assumed to be in the base currency.
+
+        Returns:
+            (converted, missing): the converted amounts and a mask of the amounts that couldn't be
+            converted (no rate for their currency). These are left as they are.
+        """
+        converted = amounts.to_numpy(dtype=np.float64, na_value=np.nan).copy()
+        currencies = currencies.astype('string')
+        foreign = (currencies.notna() & (currencies != self.base)).to_numpy(dtype=bool)
+        missing = np.zeros(len(converted), dtype=bool)
+        if not foreign.any():
+            return converted, missing
+        rows = pd.DataFrame({
+            'position': np.flatnonzero(foreign),
+            'date': pd.to_datetime(dates[foreign]).astype('datetime64[ns]').to_numpy(),
+            'currency': currencies[foreign].to_numpy(dtype=object),
+        })
+        missing[rows['position'][rows['date'].isna()].to_numpy()] = True
+        rows = rows[rows['date'].notna()].sort_values('date', kind='stable')
+        rates = pd.merge_asof(rows, self.df, on='date', by='currency', direction='backward')['rate'].to_numpy()
+        if np.isnan(rates).any():
+            # Dates before the first rate of the currency
+            rates = np.where(np.isnan(rates), pd.merge_asof(rows, self.df, on='date', by='currency',
+                                                             direction='forward')['rate'].to_numpy(), rates)
+        positions = rows['position'].to_numpy()
+        found = ~np.isnan(rates)
+        converted[positions[found]] *= rates[found]
+        missing[positions[~found]] = True
+        return converted, missing
+
+class CurrencyNormalizer:
+    """
+    Adds the 'amount_base' column to the master account: the amount of every transaction in the
+    reporting currency (see FxRates.convert). Registered by App.define_fx_rates.
+
+    Attributes:
+        rates:      The exchange rates.
+        merger:     Merger that adds the column.
+    """
+    rates: FxRates
+    merger: Merger
+
+    def __init__(self, rates: FxRates):
+        self.rates = rates
+        self.merger = Merger(self.apply_merger, 'currency_normalizer')
+
+    def apply(self, df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Add the amount_base column to a DataFrame.
+
+        Returns:
+            The DataFrame and the mask of the transactions that couldn't be converted.
+        """
+        if len(df) == 0 or 'amount' not in df.columns:
+            return df, np.zeros(len(df), dtype=bool)
+        currencies = df['currency'] if 'currency' in df.columns else pd.Series(pd.NA, index=df.index)
+        converted, missing = self.rates.convert(df['amount'], currencies, df['date'])
+        return df.assign(**{ AMOUNT_BASE_COLUMN: converted }), missing
+
+    def apply_merger(self, ctx: MergeContext, df: pd.DataFrame) -> pd.DataFrame:
+        """Merger adapter for apply(). Reports the transactions left in their own currency."""
+        df, missing = self.apply(df)
+        if missing.any():
+            currencies = df['currency'][missing].astype(str).value_counts()
+            ctx.diag_warning("No exchange rate to {base} for {count} transactions ({currencies}), amount_base left unconverted",
+                             base=self.rates.base, count=int(missing.sum()),
+                             currencies=', '.join(f"{c}: {n}" for c, n in currencies.items()))
+        return df
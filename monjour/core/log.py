@@ -5,30 +5,39 @@ Monjour Logging Module
 - Defines a logger class (MjLogger) for more advanced use cases
 """
 import logging
-import colorama
 import monjour.core.globals as mj_globals
 
-# Initialize colorama
-colorama.init()
-
 # Define a custom formatter
 class ColorFormatter(logging.Formatter):
-    # Define colors for each level
-    LEVEL_COLORS = {
-        'DEBUG': colorama.Fore.GREEN,
-        'INFO': colorama.Fore.BLUE,
-        'WARNING': colorama.Fore.YELLOW,
-        'ERROR': colorama.Fore.RED,
-        'CRITICAL': colorama.Back.RED + colorama.Fore.WHITE,
-    }
+    # Colors for each level, set when the first record is formatted so that importing
+    # this module doesn't import and initialize colorama
+    LEVEL_COLORS: dict[str, str]|None = None
+    RESET_COLOR: str = ''
+
+    @classmethod
+    def _init_colors(cls):
+        import colorama
+        colorama.init()
+        cls.LEVEL_COLORS = {
+            'DEBUG': colorama.Fore.GREEN,
+            'INFO': colorama.Fore.BLUE,
+            'WARNING': colorama.Fore.YELLOW,
+            'ERROR': colorama.Fore.RED,
+            'CRITICAL': colorama.Back.RED + colorama.Fore.WHITE,
+        }
+        cls.RESET_COLOR = colorama.Style.RESET_ALL
 
     def format(self, record):
+        if self.LEVEL_COLORS is None:
+            self._init_colors()
+        assert self.LEVEL_COLORS is not None
+
         # Get the original log message
         original_format = super().format(record)
 
         # Apply color to the levelname only
         level_color = self.LEVEL_COLORS.get(record.levelname, '')
-        reset_color = colorama.Style.RESET_ALL
+        reset_color = self.RESET_COLOR
         record.levelname = f"{level_color}{record.levelname}{reset_color}"  # Colorize the levelname
 
         # Reformat with the modified levelname
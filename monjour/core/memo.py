@@ -0,0 +1,160 @@
+"""
+Memoization of per-value computations (parsing, categorization, ...)
+
+Transaction descriptions repeat heavily: the same merchant or the same fee appears hundreds of times.
+map_unique() runs a function only on the distinct values of a column and broadcasts the results back
+to the rows through the codes returned by pd.factorize. A MemoTable can be attached to it to remember
+the results across runs, so the work scales with the number of distinct values ever seen.
+
+Memo tables are filled by the importers, possibly from several threads at once (see
+App.import_files_by_account), and saved by the App once per operation (see save_memos).
+"""
+import json
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Callable, TypedDict
+
+from monjour.core.log import MjLogger
+
+log = MjLogger(__name__)
+
+class MemoInfo(TypedDict):
+    """
+    Persisted memo table. Serialized to disk in JSON format. Usually in $appdata_dir/memo/<name>.json
+    """
+    name: str
+    version: str
+    entries: dict[str, dict[str, Any]]
+
+class MemoTable:
+    """
+    Persistent table mapping a normalized key (e.g. a transaction description) to the values
+    that were computed for it.
+
+    The table is versioned: if the version stored on disk doesn't match the version of the table,
+    the stored entries are discarded. Bump the version whenever the memoized function changes.
+
+    The table is thread safe: reads, writes, loads and saves are serialized by a lock.
+
+    Attributes:
+        name:       Name of the table, used as the file name.
+        version:    Version of the function that produced the entries.
+        entries:    The memoized values.
+        path:       Where the table is persisted. None if the table is only kept in memory.
+    """
+    name: str
+    version: str
+    entries: dict[str, dict[str, Any]]
+    path: Path|None
+    _dirty: bool
+    _lock: threading.Lock
+
+    def __init__(self, name: str, version: str):
+        self.name = name
+        self.version = version
+        self.entries = {}
+        self.path = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        MEMO_TABLES.append(self)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> dict[str, Any]|None:
+        with self._lock:
+            return self.entries.get(key)
+
+    def set(self, key: str, value: dict[str, Any]):
+        with self._lock:
+            self.entries[key] = value
+            self._dirty = True
+
+    def attach(self, memo_dir: Path|str):
+        """
+        Persist the table in memo_dir. The entries already on disk are loaded the first time
+        the table is attached to a directory.
+        """
+        path = Path(memo_dir) / f"{self.name}.json"
+        with self._lock:
+            if self.path == path:
+                return
+            self.path = path
+            self._load()
+
+    def load(self):
+        """Load the entries from disk, merging them with the ones in memory."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            info: MemoInfo = json.loads(self.path.read_bytes())
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Memo table '{self.name}' could not be loaded and will be rebuilt: {e}")
+            return
+        if info['version'] != self.version:
+            log.info(f"Memo table '{self.name}' is outdated (v{info['version']}), it will be rebuilt")
+            self._dirty = True
+            return
+        self.entries = { **info['entries'], **self.entries }
+
+    def save(self):
+        """Save the table to disk. Does nothing if nothing changed since the last save."""
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            info: MemoInfo = { 'name': self.name, 'version': self.version, 'entries': self.entries }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(info))
+            self._dirty = False
+
+# All the memo tables, see save_memos
+MEMO_TABLES: list[MemoTable] = []
+
+def save_memos():
+    """Save the memo tables that changed. Called by the App at the end of every import and run."""
+    for table in MEMO_TABLES:
+        table.save()
+
+def map_unique(
+    keys: pd.Series,
+    fn: Callable[[str], dict[str, Any]],
+    memo: MemoTable|None = None,
+) -> pd.DataFrame:
+    """
+    Apply fn to every distinct value of keys and broadcast the results back to the rows.
+
+    Args:
+        keys:   Series containing the (already normalized) keys.
+        fn:     Function computing a dict of values from a key. Fields missing from a dict are missing values.
+        memo:   Optional memo table used to skip keys that were already computed (even in previous runs).
+
+    Returns:
+        DataFrame with the same index of keys and one column per field returned by fn.
+        Rows with a missing key have missing values.
+    """
+    codes, uniques = pd.factorize(keys)
+    records = []
+    for key in uniques:
+        if memo is not None and (value := memo.get(key)) is not None:
+            records.append(value)
+            continue
+        value = fn(key)
+        if memo is not None:
+            memo.set(key, value)
+        records.append(value)
+    unique_df = pd.DataFrame.from_records(records) if records else pd.DataFrame()
+    # Add an all-missing row at the end so that missing keys (code -1) select it
+    unique_df = pd.concat([unique_df, pd.DataFrame([{}], columns=unique_df.columns)], ignore_index=True)
+    codes = np.where(codes >= 0, codes, len(unique_df) - 1)
+    result = unique_df.take(codes)
+    result.index = keys.index
+    return result
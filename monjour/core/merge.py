@@ -83,6 +83,9 @@ class MergeContext(DiagnosticCollector):
         return ctx
 
     def _diag_prefix(self) -> str:
+        # Stages that run after all the accounts have been merged are not bound to an account
+        if self._cur_account_index >= len(self.accounts):
+            return 'merge stage: '
         return self.current_account.id + ' merger: '
 
 # Official type for Merger object. Its really just a wrapper
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from monjour.core.dedup import transaction_ids
+from monjour.core.transaction import PaymentType, TransactionID
+from monjour.core.merge import MergeContext, Merger
+
+class RefundLinker:
+    """
+    Links every refund (a positive transaction with the Refund payment type) to the payment it
+    refunds: the latest earlier payment of the same account and counterpart, at most `window`
+    before the refund. Payments with the same amount as the refund are preferred (full refunds,
+    each payment is refunded at most once), otherwise the latest payment at least as large as the
+    refund, and not fully refunded, is used (partial refunds). The 'ref' column of the refund is
+    set to the ID of the payment (see monjour.core.dedup.transaction_ids).
+
+    Payments are indexed by (account, counterpart) and sorted by date, and the refunds are joined
+    with them with pd.merge_asof, so the whole history is linked in O(n log n).
+
+    The links are remembered across merges: after an import only the new refunds, and the refunds
+    that were not linked yet, are joined again with the payments of their accounts and counterparts.
+    Every merge still computes the IDs of the transactions of the accounts holding refunds, to find
+    the refunds and payments of the remembered links in the new master account.
+
+    Define it after the TransferMatcher, if any: the legs of the internal transfers are never taken
+    as refunded payments, and the TransferMatcher never pairs a refund.
+
+    Example:
+        refunds = RefundLinker(window='90D')
+        app.define_merge_stages(refunds.merger)
+
+    Attributes:
+        window:     Maximum time between a payment and its refund.
+        merger:     Merger that links the refunds.
+    """
+    window: pd.Timedelta
+    merger: Merger
+
+    # refund ID -> payment ID, for the refunds linked by the previous merges
+    _links: dict[TransactionID, TransactionID]
+
+    def __init__(self, window: pd.Timedelta|str = '180D'):
+        self.window = pd.Timedelta(window)
+        self.merger = Merger(self.apply_merger, 'refund_linker')
+        self._links = {}
+
+    def link(self, df: pd.DataFrame, ids: pd.Series|None = None) -> np.ndarray:
+        """
+        Find the payment refunded by every refund.
+
+        Args:
+            df:     The transactions.
+            ids:    Their IDs (see transaction_ids). Computed if not provided.
+
+        Returns:
+            Array with the same length of df, containing the position (in df) of the payment
+            refunded by each transaction or -1.
+        """
+        return self._link(df, ids)[0]
+
+    def _link(self, df: pd.DataFrame, ids: pd.Series|None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        link(), also returning the IDs of the transactions as an object array. Only the IDs of the
+        transactions of the accounts holding refunds are computed, the others are None.
+        """
+        payment = np.full(len(df), -1, dtype=np.int64)
+        id_values = np.full(len(df), None, dtype=object)
+        if len(df) == 0 or not {'date', 'amount', 'payment_type'}.issubset(df.columns):
+            return payment, id_values
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        payment_type = df['payment_type'].astype(object)
+        is_refund = (payment_type == PaymentType.Refund.value).to_numpy(dtype=bool) & (amounts > 0)
+        if not is_refund.any():
+            return payment, id_values
+        is_payment = ~payment_type.isin([PaymentType.Refund.value, PaymentType.InternalTransfer.value]).to_numpy(dtype=bool) \
+            & (amounts < 0)
+
+        # Refunds and payments are in the same account, and the ID of a transaction only depends on the
+        # transactions of its account: only the accounts holding refunds are hashed
+        accounts = df['account_id'].astype(object) if 'account_id' in df.columns else pd.Series('', index=df.index)
+        scope = np.flatnonzero(accounts.isin(accounts[is_refund]).to_numpy(dtype=bool))
+        if ids is not None:
+            id_values = ids.to_numpy(dtype=object)
+        elif len(scope) == len(df):
+            id_values = transaction_ids(df).to_numpy(dtype=object)
+        else:
+            id_values[scope] = transaction_ids(df.iloc[scope]).to_numpy(dtype=object)
+
+        # Links found by the previous merges
+        positions = pd.Index(id_values[scope])
+        cached = pd.Series(self._links, dtype=object).reindex(id_values[is_refund]).to_numpy(dtype=object)
+        cached_positions = positions.get_indexer(cached)
+        linked = cached_positions >= 0
+        payment[np.flatnonzero(is_refund)[linked]] = scope[cached_positions[linked]]
+
+        # New refunds, and refunds that couldn't be linked yet, against the payments of their accounts
+        # and counterparts. Only these rows are joined
+        pending = is_refund & (payment < 0)
+        if not pending.any():
+            return payment, id_values
+        cents = np.round(np.abs(np.nan_to_num(amounts)) * 100).astype(np.int64)
+        rows = np.flatnonzero(pending | (is_payment & accounts.isin(accounts[pending]).to_numpy(dtype=bool)))
+        subset = df.iloc[rows]
+        counterpart = subset['counterpart'] if 'counterpart' in subset.columns else pd.Series(pd.NA, index=subset.index)
+        legs = pd.DataFrame({
+            'position': rows,
+            'key': accounts.iloc[rows].astype('string').fillna('').to_numpy(dtype=object)
+                   + '/' + counterpart.astype('string').str.lower().str.strip().fillna('').to_numpy(dtype=object),
+            'date': pd.to_datetime(subset['date']).to_numpy(),
+            'cents': cents[rows],
+        })
+        legs = legs[legs['date'].notna()]
+        refunds = legs[pending[legs['position'].to_numpy()]]
+        # Payments fully refunded by the refunds linked so far
+        claimed = np.zeros(len(df), dtype=bool)
+        full = (payment >= 0) & (cents == cents[np.maximum(payment, 0)])
+        claimed[payment[full]] = True
+        payments = legs[is_payment[legs['position'].to_numpy()] & legs['key'].isin(refunds['key']).to_numpy()]
+        payments = payments.assign(date_payment=payments['date']).sort_values('date', kind='stable')
+
+        # Full refunds: each payment is refunded once, the closest refund wins
+        while len(refunds) > 0:
+            free = payments[~claimed[payments['position'].to_numpy()]]
+            pairs = self._join(refunds, free, by=['key', 'cents'])
+            if len(pairs) == 0:
+                break
+            pairs = pairs.sort_values(['gap', 'position'], kind='stable').drop_duplicates('position_payment')
+            payment[pairs['position'].to_numpy()] = pairs['position_payment'].to_numpy(dtype=np.int64)
+            claimed[pairs['position_payment'].to_numpy(dtype=np.int64)] = True
+            refunds = refunds[payment[refunds['position'].to_numpy()] < 0]
+
+        # Partial refunds: the latest payment of the counterpart not fully refunded, if at least as large as the refund
+        if len(refunds) > 0:
+            free = payments[~claimed[payments['position'].to_numpy()]]
+            pairs = self._join(refunds, free.rename(columns={'cents': 'cents_payment'}), by=['key'])
+            pairs = pairs[pairs['cents_payment'] >= pairs['cents']]
+            payment[pairs['position'].to_numpy()] = pairs['position_payment'].to_numpy(dtype=np.int64)
+        return payment, id_values
+
+    def _join(self, refunds: pd.DataFrame, payments: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+        """Latest payment before each refund (within the window) with the same values of the by columns."""
+        joined = pd.merge_asof(
+            refunds.sort_values('date', kind='stable'), payments,
+            on='date', by=by, tolerance=self.window, direction='backward', suffixes=('', '_payment'),
+        ).dropna(subset=['position_payment'])
+        return joined.assign(gap=joined['date'] - joined['date_payment'])
+
+    def apply(self, df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Link the refunds of a DataFrame and remember the links for the next merges.
+
+        Returns:
+            The DataFrame with the 'ref' column of the refunds updated and the array returned by link().
+        """
+        payment, id_values = self._link(df)
+        linked = payment >= 0
+        if not linked.any():
+            return df, payment
+        self._links.update(zip(id_values[linked], id_values[payment[linked]]))
+        df = df.copy()
+        if 'ref' not in df.columns:
+            df['ref'] = pd.Series(pd.NA, index=df.index, dtype='string')
+        # Assign by position, the index of the master DataFrame is not guaranteed to be unique
+        df.iloc[np.flatnonzero(linked), df.columns.get_loc('ref')] = id_values[payment[linked]]
+        return df, payment
+
+    def apply_merger(self, ctx: MergeContext, df: pd.DataFrame) -> pd.DataFrame:
+        """Merger adapter for apply(). Records how many refunds were linked."""
+        df, payment = self.apply(df)
+        n_refunds = int((df['payment_type'] == PaymentType.Refund.value).sum()) if 'payment_type' in df.columns else 0
+        ctx.diag_info("Linked {linked} of {total} refunds", linked=int((payment >= 0).sum()), total=n_refunds)
+        return df
@@ -1,7 +1,330 @@
+import numpy as np
 import pandas as pd
-from typing import Callable, TYPE_CHECKING
 
-from monjour.utils.diagnostics import DiagnosticCollector
+from monjour.core.transaction import PaymentType
+from monjour.core.merge import MergeContext, Merger
+from monjour.utils.keyword_matcher import KeywordMatcher
 
-if TYPE_CHECKING:
-    from monjour.core.account import Account
+class Rule:
+    """
+    A categorization rule. A rule matches transactions on any combination of the fields below
+    and assigns a category and/or notes to the matched transactions.
+
+    Every condition that is set must be satisfied for a transaction to match (AND semantics).
+    Conditions that accept a list match if any of the values in the list match (OR semantics).
+
+    Attributes:
+        category:       Category to assign to the matched transactions.
+        notes:          Notes to assign to the matched transactions.
+        desc:           Pattern to search for in the 'desc' column.
+        counterpart:    Pattern to search for in the 'counterpart' column.
+        amount_min:     Minimum amount (inclusive).
+        amount_max:     Maximum amount (inclusive).
+        account_id:     Account ID(s) the transaction must belong to.
+        payment_type:   Payment type(s) the transaction must have.
+        regex:          If True, desc and counterpart are treated as regular expressions.
+        case:           If True, desc and counterpart matching is case sensitive.
+        priority:       Rules with higher priority are evaluated first. Rules with the same
+                        priority are evaluated in the order they were defined.
+        name:           Optional name used in diagnostics.
+    """
+    category: str|None
+    notes: str|None
+    desc: str|None
+    counterpart: str|None
+    amount_min: float|None
+    amount_max: float|None
+    account_id: list[str]|None
+    payment_type: list[str]|None
+    regex: bool
+    case: bool
+    priority: int
+    name: str
+
+    def __init__(
+        self,
+        category: str|None = None,
+        notes: str|None = None,
+        desc: str|None = None,
+        counterpart: str|None = None,
+        amount_min: float|None = None,
+        amount_max: float|None = None,
+        account_id: str|list[str]|None = None,
+        payment_type: PaymentType|list[PaymentType]|None = None,
+        regex: bool = False,
+        case: bool = False,
+        priority: int = 0,
+        name: str|None = None,
+    ):
+        if category is None and notes is None:
+            raise ValueError("A rule must assign at least one of 'category' or 'notes'")
+        self.category = category
+        self.notes = notes
+        self.desc = desc
+        self.counterpart = counterpart
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+        if isinstance(account_id, str):
+            account_id = [account_id]
+        self.account_id = account_id
+        if isinstance(payment_type, PaymentType):
+            payment_type = [payment_type]
+        self.payment_type = None if payment_type is None else [p.value for p in payment_type]
+        self.regex = regex
+        self.case = case
+        self.priority = priority
+        self.name = name or f"Rule({category or notes})"
+
+    def __repr__(self) -> str:
+        return self.name
+
+    def mask(self, df: pd.DataFrame, factorized: "FactorizedColumns|None" = None) -> pd.Series:
+        """
+        Evaluate the rule over the whole DataFrame and return a boolean mask of the matched rows.
+        All conditions are evaluated with vectorized column operations. Text conditions are
+        evaluated only on the distinct values of the column.
+
+        Args:
+            df:         DataFrame to evaluate the rule on.
+            factorized: Optional cache of the factorized text columns of df, shared between rules.
+        """
+        if factorized is None:
+            factorized = FactorizedColumns(df)
+        mask = pd.Series(True, index=df.index)
+        if self.account_id is not None:
+            mask &= df['account_id'].isin(self.account_id)
+        if self.payment_type is not None:
+            mask &= df['payment_type'].isin(self.payment_type)
+        if self.amount_min is not None:
+            mask &= df['amount'] >= self.amount_min
+        if self.amount_max is not None:
+            mask &= df['amount'] <= self.amount_max
+        if self.desc is not None:
+            mask &= factorized.contains('desc', self.desc, self.case, self.regex)
+        if self.counterpart is not None:
+            mask &= factorized.contains('counterpart', self.counterpart, self.case, self.regex)
+        return mask
+
+class FactorizedColumns:
+    """
+    Lazily factorizes the text columns of a DataFrame so that text conditions can be evaluated
+    once per distinct value and broadcasted back to the rows through the codes.
+    """
+    df: pd.DataFrame
+    columns: dict[str, tuple[np.ndarray, pd.Series]]
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.columns = {}
+
+    def get(self, column: str) -> tuple[np.ndarray, pd.Series]:
+        """Returns the codes and the distinct values of a column."""
+        if column not in self.columns:
+            codes, uniques = pd.factorize(self.df[column])
+            self.columns[column] = (codes, pd.Series(uniques, dtype='string'))
+        return self.columns[column]
+
+    def contains(self, column: str, pattern: str, case: bool, regex: bool) -> pd.Series:
+        """Vectorized str.contains evaluated on the distinct values of the column."""
+        codes, uniques = self.get(column)
+        unique_hits = uniques.str.contains(pattern, case=case, regex=regex).fillna(False).to_numpy(dtype=bool)
+        hits = np.where(codes >= 0, unique_hits[codes], False)
+        return pd.Series(hits, index=self.df.index)
+
+class RuleEngine:
+    """
+    Applies a list of rules to the master DataFrame.
+
+    Each rule is compiled into a boolean mask that is evaluated once over the whole DataFrame.
+    Text columns are factorized once and shared between all the rules.
+    A transaction is claimed by the first rule that matches it (rules are sorted by priority, then
+    by definition order), so later rules never override earlier ones.
+
+    By default only transactions without a category are considered, so categories assigned by the
+    importers are preserved. Set overwrite to True to let the rules override them.
+
+    Attributes:
+        rules:      Rules known to the engine, in evaluation order.
+        overwrite:  If True, rules are applied to all the transactions.
+        merger:     Merger that applies the rules. Registered by App.define_rules.
+    """
+    rules: list[Rule]
+    overwrite: bool
+    merger: Merger
+
+    def __init__(self, rules: list[Rule]|None = None, overwrite: bool = False):
+        self.rules = []
+        self.overwrite = overwrite
+        self.merger = Merger(self.apply_merger, 'rule_engine')
+        self.add(*(rules or []))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def add(self, *rules: Rule):
+        """Add rules to the engine. Rules are kept sorted by priority (stable)."""
+        self.rules.extend(rules)
+        self.rules.sort(key=lambda r: -r.priority)
+
+    def match(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Find the rule that claims each row.
+
+        Returns:
+            Array with the same length of df, containing the index (in self.rules) of the
+            rule that matched each row or -1 if no rule matched.
+        """
+        rule_index = np.full(len(df), -1, dtype=np.int64)
+        if self.overwrite or 'category' not in df.columns:
+            remaining = np.ones(len(df), dtype=bool)
+        else:
+            remaining = df['category'].isna().to_numpy()
+        factorized = FactorizedColumns(df)
+        for i, rule in enumerate(self.rules):
+            if not remaining.any():
+                break
+            matched = rule.mask(df, factorized).to_numpy() & remaining
+            rule_index[matched] = i
+            remaining &= ~matched
+        return rule_index
+
+    def apply(self, df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Apply the rules to a DataFrame.
+
+        Returns:
+            The DataFrame with the 'category' and 'notes' columns updated and the array
+            returned by match().
+        """
+        rule_index = self.match(df)
+        matched = rule_index >= 0
+        if not matched.any():
+            return df, rule_index
+        df = df.copy()
+        for column in ('category', 'notes'):
+            values = np.array([getattr(rule, column) for rule in self.rules], dtype=object)
+            assigned = values[rule_index[matched]]
+            # Rules that don't set this column leave the previous value untouched
+            has_value = pd.notna(assigned)
+            if not has_value.any():
+                continue
+            if column not in df.columns:
+                df[column] = pd.Series(pd.NA, index=df.index, dtype='string')
+            # Assign by position, the index of the master DataFrame is not guaranteed to be unique
+            positions = np.flatnonzero(matched)[has_value]
+            df.iloc[positions, df.columns.get_loc(column)] = assigned[has_value]
+        return df, rule_index
+
+    def apply_merger(self, ctx: MergeContext, df: pd.DataFrame) -> pd.DataFrame:
+        """Merger adapter for apply(). Records how many transactions were categorized."""
+        df, rule_index = self.apply(df)
+        n_matched = int((rule_index >= 0).sum())
+        ctx.diag_info("Rules matched {matched} of {total} transactions", matched=n_matched, total=len(df))
+        return df
+
+class KeywordCategorizer:
+    """
+    Assigns categories based on merchant keywords ("the description contains one of these words").
+
+    All the keywords are compiled into a single KeywordMatcher, and every distinct value of the
+    scanned columns is scanned only once. The results are then broadcasted back to the rows through
+    the codes returned by pd.factorize, so the work scales with the number of distinct values.
+
+    Columns are scanned in order: a match in the first column takes precedence over a match in the
+    following ones. Within a column, the keyword that was added first wins.
+
+    Example:
+        categorizer = KeywordCategorizer({
+            'Expenses/Groceries': ['esselunga', 'carrefour'],
+            'Expenses/Transport': ['atm milano', 'trenitalia'],
+        })
+        app.define_merge_stages(categorizer.merger)
+
+    Attributes:
+        columns:    Columns to scan for keywords.
+        overwrite:  If True, the categories assigned by the importers can be overridden.
+        merger:     Merger that applies the categorizer.
+    """
+    columns: list[str]
+    overwrite: bool
+    merger: Merger
+
+    _matcher: KeywordMatcher
+    # Category of each keyword, indexed like the keywords in the matcher
+    _categories: list[str]
+
+    def __init__(
+        self,
+        keywords: dict[str, list[str]]|None = None,
+        columns: list[str] = ['counterpart', 'desc'],
+        case: bool = False,
+        overwrite: bool = False,
+    ):
+        self.columns = list(columns)
+        self.overwrite = overwrite
+        self._matcher = KeywordMatcher(case=case)
+        self._categories = []
+        self.merger = Merger(self.apply_merger, 'keyword_categorizer')
+        for category, category_keywords in (keywords or {}).items():
+            self.add(category, *category_keywords)
+
+    def __len__(self) -> int:
+        return len(self._matcher)
+
+    def add(self, category: str, *keywords: str):
+        """Add keywords that map to a category."""
+        for keyword in keywords:
+            self._matcher.add(keyword)
+            self._categories.append(category)
+
+    def match(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Find the keyword that matches each row.
+
+        Returns:
+            Array with the same length of df, containing the index of the keyword that matched
+            each row or -1 if no keyword matched.
+        """
+        keyword_index = np.full(len(df), -1, dtype=np.int64)
+        if self.overwrite or 'category' not in df.columns:
+            remaining = np.ones(len(df), dtype=bool)
+        else:
+            remaining = df['category'].isna().to_numpy()
+        for column in self.columns:
+            if not remaining.any():
+                break
+            if column not in df.columns:
+                continue
+            # Only scan the distinct values of the rows that still need a category
+            codes, uniques = pd.factorize(df[column][remaining])
+            unique_hits = self._matcher.find_many(uniques)
+            hits = np.where(codes >= 0, unique_hits[codes], -1)
+            rows = np.flatnonzero(remaining)[hits >= 0]
+            keyword_index[rows] = hits[hits >= 0]
+            remaining[rows] = False
+        return keyword_index
+
+    def apply(self, df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Apply the categorizer to a DataFrame.
+
+        Returns:
+            The DataFrame with the 'category' column updated and the array returned by match().
+        """
+        keyword_index = self.match(df)
+        matched = keyword_index >= 0
+        if not matched.any():
+            return df, keyword_index
+        df = df.copy()
+        if 'category' not in df.columns:
+            df['category'] = pd.Series(pd.NA, index=df.index, dtype='string')
+        categories = np.array(self._categories, dtype=object)
+        df.iloc[np.flatnonzero(matched), df.columns.get_loc('category')] = categories[keyword_index[matched]]
+        return df, keyword_index
+
+    def apply_merger(self, ctx: MergeContext, df: pd.DataFrame) -> pd.DataFrame:
+        """Merger adapter for apply(). Records how many transactions were categorized."""
+        df, keyword_index = self.apply(df)
+        n_matched = int((keyword_index >= 0).sum())
+        ctx.diag_info("Keywords matched {matched} of {total} transactions", matched=n_matched, total=len(df))
+        return df
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import Mapping
+
+from monjour.core.archive import ArchiveRecord
+from monjour.core.balance import RunningBalance
+from monjour.core.category import CategoryTree
+from monjour.core.common import time_buckets
+from monjour.core.cube import AggregateCube
+from monjour.core.frame_index import FrameIndex
+
+@dataclass(frozen=True)
+class AppSnapshot:
+    """
+    Consistent, read-only view of the state of an App at a given version.
+
+    Writers (imports, merges, App.run) never modify a published snapshot: they build the new state
+    under App.write_lock and publish a new snapshot with a single assignment. Readers (e.g. streamlit
+    pages rendering concurrently in other sessions) take App.snapshot once and read everything from it,
+    so they never observe a half-applied import or merge.
+
+    The DataFrames are shared with the App and must be treated as read-only.
+
+    Attributes:
+        version:            Unique version of the snapshot (see App.df_version).
+        df:                 The master account.
+        accounts_data:      Transactions of each account, by account id.
+        account_balances:   Running balance of each account, by account id.
+        archive_records:    Records of the archive, by archive id.
+        cube:               Daily aggregates of the master account.
+        category_tree:      Tree of the categories.
+        category_rollup:    Monthly totals of every node of the category tree.
+    """
+    version: int
+    df: pd.DataFrame
+    accounts_data: Mapping[str, pd.DataFrame]
+    account_balances: Mapping[str, RunningBalance]
+    archive_records: Mapping[str, ArchiveRecord]
+    cube: AggregateCube
+    category_tree: CategoryTree
+    category_rollup: pd.DataFrame
+
+    @staticmethod
+    def empty() -> "AppSnapshot":
+        return AppSnapshot(0, pd.DataFrame(), MappingProxyType({}), MappingProxyType({}), MappingProxyType({}),
+                           AggregateCube(), CategoryTree(), pd.DataFrame())
+
+    @cached_property
+    def buckets(self) -> pd.DataFrame:
+        """
+        The 'day', 'week', 'month' and 'year' columns of the master account (aligned with df),
+        holding the start of the period of each transaction. Computed once per snapshot.
+        """
+        dates = self.df['date'] if 'date' in self.df.columns else pd.Series(dtype='datetime64[ns]')
+        return time_buckets(dates)
+
+    @cached_property
+    def date_index(self) -> tuple[np.ndarray|None, pd.DatetimeIndex]:
+        """
+        Order of the master account by date, used to select date ranges with a binary search (see
+        StApp.view): the positions of the rows of df sorted by date (stable), or None if df is
+        already sorted, and the sorted dates. Computed once per snapshot.
+        """
+        dates = self.df['date'] if 'date' in self.df.columns else pd.Series(dtype='datetime64[ns]')
+        if dates.is_monotonic_increasing:
+            return None, pd.DatetimeIndex(dates)
+        order = np.argsort(dates.to_numpy(), kind='stable')
+        return order, pd.DatetimeIndex(dates.to_numpy()[order])
+
+    @cached_property
+    def index(self) -> FrameIndex:
+        """Per-column indexes of the master account, used to filter it (see FrameIndex)."""
+        return FrameIndex(self.df, self.version)
+
+    @cached_property
+    def archive_df(self) -> pd.DataFrame:
+        """The archive records as a DataFrame."""
+        return pd.DataFrame.from_records(list(self.archive_records.values()))
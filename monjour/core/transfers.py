@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from monjour.core.dedup import transaction_ids
+from monjour.core.transaction import PaymentType
+from monjour.core.merge import MergeContext, Merger
+
+class TransferMatcher:
+    """
+    Links the two legs of the transfers between the accounts of the app (e.g. a bank transfer that
+    tops up a PayPal account): an outgoing transaction of one account and an incoming transaction of
+    another account, with the same absolute amount and currency, at most `tolerance` apart.
+    Refunds (the Refund payment type, set by the importers) are never legs of a transfer.
+
+    Matched transactions get the InternalTransfer payment type and their 'ref' points to the ID of
+    the other leg (see monjour.core.dedup.transaction_ids). Internal transfers only move money
+    between the accounts, so the reports count them neither as income nor as expenses.
+
+    Transactions are bucketed by amount (in cents) and currency, and each account's outgoing
+    transactions are joined with the nearest incoming transaction of the other accounts with
+    pd.merge_asof, so the work is O(n log n) instead of comparing every pair. Each incoming
+    transaction is paired at most once: when several outgoing transactions claim it the closest one
+    wins, and the others are joined again with the remaining incoming transactions.
+
+    Define it before the RefundLinker, if any: the merge stages run in order and the RefundLinker
+    doesn't take the legs of the transfers as refunded payments.
+
+    Example:
+        transfers = TransferMatcher(tolerance=dt.timedelta(days=3))
+        refunds = RefundLinker(window='90D')
+        app.define_merge_stages(transfers.merger, refunds.merger)
+
+    Attributes:
+        tolerance:  Maximum time between the two legs of a transfer.
+        accounts:   Accounts whose transactions can be matched. Defaults to all of them.
+        merger:     Merger that links the transfers.
+    """
+    tolerance: pd.Timedelta
+    accounts: list[str]|None
+    merger: Merger
+
+    def __init__(self, tolerance: pd.Timedelta|str = '3D', accounts: list[str]|None = None):
+        self.tolerance = pd.Timedelta(tolerance)
+        self.accounts = None if accounts is None else list(accounts)
+        self.merger = Merger(self.apply_merger, 'transfer_matcher')
+
+    def match(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Find the other leg of every transfer.
+
+        Returns:
+            Array with the same length of df, containing the position (in df) of the other leg of
+            each transaction or -1 if the transaction is not an internal transfer.
+        """
+        partner = np.full(len(df), -1, dtype=np.int64)
+        if len(df) == 0 or not {'account_id', 'date', 'amount'}.issubset(df.columns):
+            return partner
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        legs = pd.DataFrame({
+            'position': np.arange(len(df)),
+            'account_id': df['account_id'].astype('string').to_numpy(dtype=object),
+            'date': pd.to_datetime(df['date']).to_numpy(),
+            'cents': np.round(np.abs(np.nan_to_num(amounts)) * 100).astype(np.int64),
+            'currency': df['currency'].astype('string').fillna('').to_numpy(dtype=object)
+                        if 'currency' in df.columns else '',
+        })
+        valid = (amounts != 0) & ~np.isnan(amounts) & legs['date'].notna().to_numpy()
+        if self.accounts is not None:
+            valid &= legs['account_id'].isin(self.accounts).to_numpy()
+        if 'payment_type' in df.columns:
+            # A refund with the amount of a debit of another account is not the other leg of a transfer
+            valid &= (df['payment_type'].astype(object) != PaymentType.Refund.value).to_numpy(dtype=bool)
+        outgoing = legs[valid & (amounts < 0)]
+        incoming = legs[valid & (amounts > 0)]
+        # Only the buckets with both an outgoing and an incoming leg can match
+        outgoing = outgoing[outgoing.set_index(['cents', 'currency']).index.isin(incoming.set_index(['cents', 'currency']).index)]
+        incoming = incoming.assign(date_in=incoming['date']).sort_values('date', kind='stable')
+
+        while len(outgoing) > 0 and len(incoming) > 0:
+            pairs = []
+            for account_id, out in outgoing.groupby('account_id', sort=False):
+                others = incoming[incoming['account_id'] != account_id]
+                if len(others) == 0:
+                    continue
+                joined = pd.merge_asof(
+                    out.sort_values('date', kind='stable'), others[['date', 'date_in', 'cents', 'currency', 'position']],
+                    on='date', by=['cents', 'currency'], tolerance=self.tolerance, direction='nearest',
+                    suffixes=('', '_in'),
+                )
+                pairs.append(joined.dropna(subset=['position_in']))
+            pairs = pd.concat(pairs, ignore_index=True) if len(pairs) > 0 else pd.DataFrame()
+            if len(pairs) == 0:
+                break
+            # Every incoming leg goes to the closest outgoing leg claiming it
+            pairs['gap'] = (pairs['date'] - pairs['date_in']).abs()
+            pairs = pairs.sort_values(['gap', 'position'], kind='stable').drop_duplicates('position_in')
+            out_positions = pairs['position'].to_numpy(dtype=np.int64)
+            in_positions = pairs['position_in'].to_numpy(dtype=np.int64)
+            partner[out_positions] = in_positions
+            partner[in_positions] = out_positions
+            outgoing = outgoing[partner[outgoing['position'].to_numpy()] < 0]
+            incoming = incoming[partner[incoming['position'].to_numpy()] < 0]
+        return partner
+
+    def apply(self, df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Link the transfers of a DataFrame.
+
+        Returns:
+            The DataFrame with the 'payment_type' and 'ref' columns updated and the array returned by match().
+        """
+        partner = self.match(df)
+        matched = partner >= 0
+        if not matched.any():
+            return df, partner
+        df = df.copy()
+        positions = np.flatnonzero(matched)
+        ids = transaction_ids(df).to_numpy(dtype=object)
+        for column, values in (('payment_type', PaymentType.InternalTransfer.value), ('ref', ids[partner[matched]])):
+            if column not in df.columns:
+                df[column] = pd.Series(pd.NA, index=df.index, dtype='string')
+            # Assign by position, the index of the master DataFrame is not guaranteed to be unique
+            df.iloc[positions, df.columns.get_loc(column)] = values
+        return df, partner
+
+    def apply_merger(self, ctx: MergeContext, df: pd.DataFrame) -> pd.DataFrame:
+        """Merger adapter for apply(). Records how many transfers were linked."""
+        df, partner = self.apply(df)
+        n_matched = int((partner >= 0).sum()) // 2
+        ctx.diag_info("Linked {matched} internal transfers", matched=n_matched)
+        return df
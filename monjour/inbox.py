@@ -0,0 +1,207 @@
+import datetime as dt
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Mapping
+
+from monjour.core.archive import Archive
+from monjour.core.importer import ImportContext
+from monjour.core.log import MjLogger
+
+if TYPE_CHECKING:
+    from monjour.app import App
+
+log = MjLogger(__name__)
+
+@dataclass
+class InboxFile:
+    """State of a file of the inbox, as of the last scan."""
+    account_id: str
+    mtime_ns: int
+    size: int
+    # 'pending' until the file is imported, known to the archive, or failed to import
+    state: str = 'pending'
+
+@dataclass
+class InboxImport:
+    """A file imported from the inbox."""
+    time: dt.datetime
+    account_id: str
+    filename: str
+
+class Inbox:
+    """
+    Folder watched for new statements. New files are mapped to an account with glob patterns and
+    imported incrementally, without adding them to configuration.py or uploading them from the UI.
+
+    The inbox is scanned every poll_interval seconds. If the optional watchdog package is installed
+    (inotify on Linux), changes to the folder wake the scan up immediately. A file is imported only
+    once its modification time and size didn't change between two scans (so that files still being
+    copied are not imported), and only if its content is not already in the archive.
+
+    New files are imported with App.import_files_by_account (one archive commit), then the accounts
+    are merged once. Only the aggregates of the accounts that received new files are recomputed
+    (see App._update_aggregates).
+
+    Attributes:
+        app:            The app to import the files into.
+        directory:      The watched folder.
+        patterns:       Glob patterns (relative to directory) of the files of each account, by account ID.
+                        A file matching the patterns of several accounts goes to the first one.
+        poll_interval:  Seconds between two scans.
+        imported:       Files imported since the inbox was created, in order.
+    """
+    app: "App"
+    directory: Path
+    patterns: dict[str, list[str]]
+    poll_interval: float
+    imported: list[InboxImport]
+
+    _files: dict[Path, InboxFile]
+    _listeners: list[Callable[[list[ImportContext]], Any]]
+    _thread: threading.Thread|None
+    _wake: threading.Event
+    _stop: threading.Event
+    _observer: Any
+
+    def __init__(self, app: "App", directory: Path|str, patterns: Mapping[str, str|list[str]],
+                 poll_interval: float = 5.0):
+        self.app = app
+        self.directory = Path(directory)
+        self.patterns = { id: [p] if isinstance(p, str) else list(p) for id, p in patterns.items() }
+        self.poll_interval = poll_interval
+        self.imported = []
+        self._files = {}
+        self._listeners = []
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        for account_id in self.patterns:
+            if account_id not in app.accounts:
+                raise ValueError(f"Inbox: unknown account '{account_id}'")
+
+    def add_listener(self, listener: Callable[[list[ImportContext]], Any]):
+        """Call listener with the contexts of the imported files after every scan that imported something."""
+        self._listeners.append(listener)
+
+    ##############################################
+    # Scanning
+    ##############################################
+
+    def scan(self) -> dict[str, list[Path]]:
+        """
+        Stat the files of the inbox and return the files ready to be imported, by account ID:
+        files whose size and modification time didn't change since the previous scan and whose
+        content is not in the archive yet.
+        """
+        ready: dict[str, list[Path]] = {}
+        seen = set()
+        for account_id, patterns in self.patterns.items():
+            for pattern in patterns:
+                for path in sorted(self.directory.glob(pattern)):
+                    if path in seen or not path.is_file():
+                        continue
+                    seen.add(path)
+                    stat = path.stat()
+                    previous = self._files.get(path)
+                    if previous is None or (previous.mtime_ns, previous.size) != (stat.st_mtime_ns, stat.st_size):
+                        # New or modified file, wait for it to settle
+                        self._files[path] = InboxFile(account_id, stat.st_mtime_ns, stat.st_size)
+                        continue
+                    if previous.state != 'pending':
+                        continue
+                    with open(path, 'rb') as f:
+                        archive_id = Archive.calculate_archive_id(account_id, f)
+                    if archive_id in self.app.archive.records:
+                        previous.state = 'known'
+                        continue
+                    ready.setdefault(account_id, []).append(path)
+        # Forget the files that were removed from the inbox
+        for path in [p for p in self._files if p not in seen]:
+            del self._files[path]
+        return ready
+
+    def poll(self) -> list[ImportContext]:
+        """Scan the inbox once and import the new files. Returns the contexts of the imported files."""
+        with self.app.write_lock:
+            ready = self.scan()
+            if len(ready) == 0:
+                return []
+            try:
+                contexts = self.app.import_files_by_account(ready, merge=False)
+            except Exception as e:
+                # Import the files one by one, so that a bad file doesn't block the others
+                log.warning(f"Inbox: bulk import failed ({e}), importing the files one by one")
+                contexts = []
+                for account_id, paths in ready.items():
+                    for path in paths:
+                        try:
+                            contexts.extend(self.app.import_files(account_id, [path], merge=False))
+                        except Exception as e:
+                            log.error(f"Inbox: failed to import {path} into '{account_id}': {e}")
+                            self._files[path].state = 'failed'
+            if len(contexts) > 0:
+                self.app.merge_accounts()
+
+        now = dt.datetime.now()
+        for ctx in contexts:
+            self._files[Path(ctx.filename)].state = 'imported'
+            self.imported.append(InboxImport(now, ctx.account.id, ctx.filename))
+            log.info(f"Inbox: imported {ctx.filename} into '{ctx.account.id}'")
+        if len(contexts) > 0:
+            for listener in self._listeners:
+                listener(contexts)
+        return contexts
+
+    ##############################################
+    # Background thread
+    ##############################################
+
+    def start(self):
+        """Watch the inbox in a background thread. Does nothing if it is already watched."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._start_observer()
+        self._thread = threading.Thread(target=self.run_forever, name='monjour-inbox', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_forever(self):
+        """Poll the inbox until stop() is called."""
+        log.info(f"Inbox: watching {self.directory}")
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                log.error(f"Inbox: scan failed: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _start_observer(self):
+        """Wake the polling loop up on filesystem events, if watchdog is installed."""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            log.debug("Inbox: watchdog is not installed, polling only")
+            return
+        wake = self._wake
+        class WakeHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+        self._observer = Observer()
+        self._observer.schedule(WakeHandler(), str(self.directory), recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
@@ -1,6 +1,17 @@
-from monjour.app import App
-from monjour.core.category import Category
-from monjour.core.config import Config
-from monjour.core.common import DateRange
-from monjour.core.account import Account
-from monjour.core.archive import Archive
\ No newline at end of file
+from monjour.utils.lazy_import import lazy_attributes
+
+# The names are imported on first use (see lazy_attributes), `from monjour.prelude import *` imports them all
+__all__ = ['App', 'Category', 'Rule', 'KeywordCategorizer', 'TransferMatcher', 'RefundLinker', 'Config', 'DateRange', 'Account', 'Archive']
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    'App':                  'monjour.app',
+    'Category':             'monjour.core.category',
+    'Rule':                 'monjour.core.rule',
+    'KeywordCategorizer':   'monjour.core.rule',
+    'TransferMatcher':      'monjour.core.transfers',
+    'RefundLinker':         'monjour.core.refunds',
+    'Config':               'monjour.core.config',
+    'DateRange':            'monjour.core.common',
+    'Account':              'monjour.core.account',
+    'Archive':              'monjour.core.archive',
+})
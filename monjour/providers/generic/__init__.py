@@ -1 +1,7 @@
-from monjour.providers.generic.bank_account import BankAccount
\ No newline at end of file
+from monjour.utils.lazy_import import lazy_attributes
+
+__all__ = ['BankAccount']
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    'BankAccount':  'monjour.providers.generic.bank_account',
+})
@@ -1 +1,7 @@
-from monjour.providers.generic.importers.csv_importer import CSVImporter
\ No newline at end of file
+from monjour.utils.lazy_import import lazy_attributes
+
+__all__ = ['CSVImporter']
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    'CSVImporter':  'monjour.providers.generic.importers.csv_importer',
+})
@@ -4,6 +4,7 @@ from typing import IO
 from monjour.core.importer import importer, ImportContext
 from monjour.core.archive import ArchiveID
 from monjour.core.transformation import Transformer, transformer
+from monjour.core.transaction import PaymentType
 
 import monjour.providers.generic.importers.csv_importer as csv_importer
 from monjour.providers.paypal.paypal_types import PaypalTransactionType, PaypalTransaction
@@ -23,6 +24,13 @@ def map_paypal_transaction_type(transaction_type_mapping: dict[str, str]):
         return df
     return Transformer(transformer, 'map_paypal_transaction_type', transaction_type_mapping=transaction_type_mapping)
 
+@transformer()
+def map_payment_type(_ctx: ImportContext, df: pd.DataFrame) -> pd.DataFrame:
+    # Refunds are linked to the payment they refund by monjour.core.refunds.RefundLinker
+    is_refund = df['paypal_transaction_type'] == PaypalTransactionType.PAYMENT_REFUND.value
+    df.loc[is_refund, 'payment_type'] = PaymentType.Refund.value
+    return df
+
 @importer(v='1.0', locale="*")
 class PayPalImporter(csv_importer.CSVImporter):
 
@@ -33,5 +41,6 @@ class PayPalImporter(csv_importer.CSVImporter):
         csv_importer.create_deterministic_index,
         combine_date_hour,
         paypal_cast_columns,
+        map_payment_type,
         csv_importer.remove_useless_columns,
     ]
@@ -18,7 +18,7 @@ COLUMN_MAPPING = {
     'Saldo':                    'amount',
     'Codice transazione':       'paypal_transaction_id',
     'Indirizzo email mittente': 'paypal_sender_email',
-    'Nome':                     'paypal_name',
+    'Nome':                     'counterpart',
     'Nome banca':               'paypal_bank_name',
     'Conto bancario':           'paypal_bank_account',
     'Importo per spedizione e imballaggio': 'paypal_shipping_and_handling_amount',
@@ -52,6 +52,7 @@ class PayPalImporter(csv_importer.CSVImporter):
         paypal_common.paypal_cast_columns,
         paypal_common.combine_date_hour,
         paypal_common.map_paypal_transaction_type(TRANSACTION_TYPE_MAPPING),
+        paypal_common.map_payment_type,
         csv_importer.remove_useless_columns
     ]
 
@@ -1,2 +1,9 @@
-from monjour.providers.unicredit.unic_account import Unicredit
-from monjour.providers.unicredit.unic_types import UnicreditCategory, UnicreditTransaction
\ No newline at end of file
+from monjour.utils.lazy_import import lazy_attributes
+
+__all__ = ['Unicredit', 'UnicreditCategory', 'UnicreditTransaction']
+
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    'Unicredit':            'monjour.providers.unicredit.unic_account',
+    'UnicreditCategory':    'monjour.providers.unicredit.unic_types',
+    'UnicreditTransaction': 'monjour.providers.unicredit.unic_types',
+})
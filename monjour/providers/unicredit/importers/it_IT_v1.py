@@ -1,8 +1,11 @@
-import re
 import json
+import hashlib
+from pathlib import Path
+from typing import Any
 
 from monjour.core.log import MjLogger
 from monjour.core.importer import *
+from monjour.core.memo import MemoTable, map_unique
 from monjour.core.transaction import PaymentType
 from monjour.core.transformation import transformer
 from monjour.utils.regex_parser import RegexParser
@@ -85,63 +88,104 @@ PARSER.add_case(UnicreditCategory.UNKNOWN, r" {unic_id}.*")
 # Middlewares
 #####################################
 
+# The transaction id at the start of each description is unique. It is replaced with a placeholder
+# so that descriptions that only differ by their id are parsed once (and share the same memo entry)
+UNIC_ID_REGEX = r"^(\s*)(\d{15}\,\d{6})"
+UNIC_ID_PLACEHOLDER = "000000000000000,000000"
+
+# Parsing results are remembered across runs. The version changes automatically with the patterns,
+# bump PARSE_VERSION when parse_unicredit_desc changes.
+PARSE_VERSION = '1'
+PARSE_MEMO = MemoTable('unicredit_it_IT_v1', PARSE_VERSION + '-' +
+                       hashlib.md5(''.join(PARSER.cases.values()).encode()).hexdigest()[:8])
+
+# Columns derived from the description
+PARSED_COLUMNS = [
+    'unicredit_category', 'unicredit_original_desc', 'unicredit_original_date', 'desc', 'counterpart',
+    'location', 'payment_type', 'payment_type_details', 'extra'
+]
+
+def parse_unicredit_desc(desc: str) -> dict[str, Any]:
+    """
+    Parse a normalized unicredit description (multiple spaces limited to three and transaction id
+    replaced by UNIC_ID_PLACEHOLDER) into the values of the columns derived from it.
+    The 'has_unic_id' field tells whether the description contained a transaction id.
+    """
+    result = PARSER.parse(desc)
+    if result is None:
+        # The regex match for UnicreidtCategory.UNKNOWN is very permissive. If we reach this point
+        # it means the file is not of the correct format or it is malformed
+        # TODO: Rentroduce an error for malformed files
+        category, values = UnicreditCategory.UNKNOWN, { 'unic_id': None }
+    else:
+        category, values = result
+    row: dict[str, Any] = {}
+    row['has_unic_id'] = values['unic_id'] is not None
+    row['unicredit_category'] = category.value
+    row['unicredit_original_desc'] = desc[23:] # Description without unicredit_id
+    match category:
+        case UnicreditCategory.FIXED_MONTHLY_COST:
+            row['desc'] = f"Unicredit monthly cost for {values['month']}"
+        case UnicreditCategory.PAYMENT:
+            if values['ecommerce'] is not None:
+                row['unicredit_category'] = UnicreditCategory.ECOMMERCE.value
+            else:
+                row['payment_type'] = PaymentType.CardPayment.value
+            row['payment_type_details'] = f"card:{values['card']}"
+            row['extra'] = json.dumps({
+                'provider': values['payment_provider'],
+                'original_amount': values['amount'],
+                'original_currency': values['currency']
+            })
+            row['counterpart'] = values['counterpart']
+            row['location'] = values['location']
+            row['unicredit_original_date'] = values['original_date']
+        case UnicreditCategory.SEPA_DIRECT_DEBIT:
+            row['payment_type'] = PaymentType.PreauthorizedDebit.value
+            row['counterpart'] = values['counterpart']
+        case UnicreditCategory.OUTGOING_TRANSFER:
+            row['payment_type'] = PaymentType.Transfer.value
+            row['desc'] = "Outgoing transfer"
+        case UnicreditCategory.INCOMING_TRANSFER:
+            row['payment_type'] = PaymentType.Transfer.value
+            row['counterpart'] = values['counterpart']
+            row['desc'] = "Incoming transfer from " + str(values['counterpart'])
+        case _:
+            row['desc'] = row['unicredit_original_desc']
+    return row
+
 @transformer()
 def add_unicredit_category(ctx: ImportContext, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse the unicredit description of each transaction. Descriptions are parsed once per distinct
+    value (see monjour.core.memo.map_unique) and the results are remembered in $appdata_dir/memo
+    (saved by the App at the end of the import, see monjour.core.memo.save_memos).
+    """
     PARSER.build()
-    def process_row(row):
-        # Limit multiple spaces to three
-        desc = re.sub(r'\s\s\s+', '   ', row['unicredit_original_desc'])
-        result = PARSER.parse(desc)
-        if result is None:
-            # The regex match for UnicreidtCategory.UNKNOWN is very permissive. If we reach this point
-            # it means the file is not of the correct format or it is malformed
-            # raise ValueError(f'Invalid Unicredit transaction: (file: {ctx.filename}:{row['csv_prev_index'] + 2}) {desc}')
-            # TODO: Rentroduce this error
-            # log.error(f'Invalid Unicredit transaction: (file: {ctx.filename}:{row['csv_prev_index'] + 2}) {desc}')
-            category, values = UnicreditCategory.UNKNOWN, { 'unic_id': None }
-        else:
-            category, values = result
-        row['unicredit_id'] = values['unic_id']
-        row['unicredit_category'] = category.value
-        row['unicredit_original_desc'] = desc[23:] # Description without unicredit_id
-        match category:
-            case UnicreditCategory.FIXED_MONTHLY_COST:
-                row['desc'] = f"Unicredit monthly cost for {values['month']}"
-            case UnicreditCategory.PAYMENT:
-                if values['ecommerce'] is not None:
-                    row['unicredit_category'] = UnicreditCategory.ECOMMERCE.value
-                else:
-                    row['payment_type'] = PaymentType.CardPayment.value
-                row['payment_type_details'] = f"card:{values['card']}"
-                row['extra'] = json.dumps({
-                    'provider': values['payment_provider'],
-                    'original_amount': values['amount'],
-                    'original_currency': values['currency']
-                })
-                row['counterpart'] = values['counterpart']
-                row['location'] = values['location']
-                row['unicredit_original_date'] = values['original_date']
-            case UnicreditCategory.SEPA_DIRECT_DEBIT:
-                row['payment_type'] = PaymentType.PreauthorizedDebit.value
-                row['counterpart'] = values['counterpart']
-            case UnicreditCategory.OUTGOING_TRANSFER:
-                row['payment_type'] = PaymentType.Transfer.value
-                row['desc'] = "Outgoing transfer"
-            case UnicreditCategory.INCOMING_TRANSFER:
-                row['payment_type'] = PaymentType.Transfer.value
-                row['counterpart'] = values['counterpart']
-                row['desc'] = "Incoming transfer from " + str(values['counterpart'])
-            case UnicreditCategory.UNKNOWN:
-                row['desc'] = row['unicredit_original_desc']
-                ctx.diag_warning("Failed to parse unicredit transaction (file: {file}) (id: {id})",
-                    id=str(row.name),
-                    file=str(ctx.filename) + ':' + str(row['csv_prev_index'] + 2))
-            case _:
-                row['desc'] = row['unicredit_original_desc']
-        return row
-
-    new_df = df.apply(process_row, axis=1)
-    return new_df # type: ignore
+    if (config := getattr(ctx.account, 'config', None)) is not None:
+        PARSE_MEMO.attach(Path(config.appdata_dir) / 'memo')
+
+    # Limit multiple spaces to three
+    desc = df['unicredit_original_desc'].astype('string').str.replace(r'\s\s\s+', '   ', regex=True)
+    unic_id = desc.str.extract(UNIC_ID_REGEX)[1]
+    keys = desc.str.replace(UNIC_ID_REGEX, r'\g<1>' + UNIC_ID_PLACEHOLDER, regex=True)
+    parsed = map_unique(keys, parse_unicredit_desc, PARSE_MEMO)
+
+    # Broadcast the parsed values back to the transactions
+    df['unicredit_id'] = unic_id.where(parsed['has_unic_id'].eq(True))
+    for column in PARSED_COLUMNS:
+        if column not in parsed.columns:
+            continue
+        values = parsed[column].where(parsed[column].notna(), df[column])
+        # The original date is kept as written in the description
+        df[column] = values if column == 'unicredit_original_date' else values.astype(df[column].dtype)
+
+    # Report the transactions that could not be parsed
+    unknown = df[df['unicredit_category'] == UnicreditCategory.UNKNOWN.value]
+    for id, prev_index in zip(unknown.index, unknown['csv_prev_index']):
+        ctx.diag_warning("Failed to parse unicredit transaction (file: {file}) (id: {id})",
+            id=str(id), file=str(ctx.filename) + ':' + str(prev_index + 2))
+    return df
 
 @transformer()
 def add_currency_info(ctx: ImportContext, df: pd.DataFrame) -> pd.DataFrame:
@@ -1,8 +1,9 @@
 import pandas as pd
 
+from monjour.core.dedup import without_duplicates
 from monjour.core.merge import MergeContext, merger
 
 @merger()
 def merge_unicredit(ctx: MergeContext, data: pd.DataFrame) -> pd.DataFrame:
-    return pd.concat([data, ctx.current_account.data], ignore_index=True)
+    return pd.concat([data, without_duplicates(ctx.current_account.data)], ignore_index=True)
 
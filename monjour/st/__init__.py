@@ -1 +1 @@
-from monjour.st.st_app import StApp, get_st_app, monjour_app_cache
+from monjour.st.st_app import StApp, get_st_app, monjour_app_cache, APP_RESULT_CACHE
@@ -0,0 +1,30 @@
+import time
+import streamlit as st
+
+from monjour.st import StApp
+
+def wait_for_app(st_app: StApp, poll_interval: float = 0.2):
+    """
+    Block the page until the background run of the app (see StApp.run) is finished,
+    showing the progress of the run. Pages that need App.df call this before reading it.
+    Stops the page if the run failed.
+    """
+    if st_app.is_running:
+        bar = st.progress(0.0, text="Loading...")
+        while st_app.is_running:
+            if (progress := st_app.progress) is not None:
+                bar.progress(progress.fraction, text=_progress_text(progress))
+            time.sleep(poll_interval)
+        bar.empty()
+
+    if st_app.run_error is not None:
+        st.error(f"Error while loading the archive: {st_app.run_error}")
+        st.stop()
+
+def _progress_text(progress) -> str:
+    if progress.stage == 'loading':
+        account = f" - account '{progress.account_id}'" if progress.account_id is not None else ""
+        return f"Loading files {progress.files_loaded}/{progress.files_total}{account}"
+    if progress.stage == 'merging':
+        return "Merging accounts..."
+    return "Done"
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 from typing import Any, Literal
@@ -6,28 +7,36 @@ from pandas.api.types import (
     is_numeric_dtype,
     is_object_dtype,
 )
-from streamlit_extras.mandatory_date_range import date_range_picker
 
+from monjour.core.frame_index import FrameIndex
 from monjour.st.utils import key_combine
 
-def df_explorer(df: pd.DataFrame, key: str|None = None, case: bool = False) -> pd.DataFrame:
+def df_explorer(df: pd.DataFrame, key: str, case: bool = False, index: FrameIndex|None = None) -> pd.DataFrame:
     """
     Mostly copied from streamlit_extras.dataframe_explorer.dataframe_explorer
 
-    Adds a UI on top of a dataframe to let viewers filter columns
+    Adds a UI on top of a dataframe to let viewers filter columns.
+
+    The filters run on a FrameIndex: ranges are binary searches on sorted columns, value and text filters
+    use the positions of the rows of each distinct value, and the filters are combined by intersecting
+    the positions. Only the matching rows are materialized.
 
     Args:
         df (pd.DataFrame): Original dataframe
-        case (bool, optional): If True, text inputs will be case sensitive. Defaults to True.
+        key (str): Key to use for the widgets. Must not depend on the content of df, which is rebuilt
+            on every rerun and every new version of the master account, or the filters would reset.
+        case (bool, optional): If True, text inputs will be case sensitive. Defaults to False.
+        index (FrameIndex, optional): Index of df, usually AppSnapshot.index so that it is built once
+            per version of the master account. If None, a temporary index is built.
 
     Returns:
         pd.DataFrame: Filtered dataframe
     """
-    if key is None:
-        random_key_base = pd.util.hash_pandas_object(df)
-    else:
-        random_key_base = key
+    if index is None or index.df is not df:
+        index = FrameIndex(df)
+    random_key_base = key_combine(key, 'df_explorer')
 
+    positions: np.ndarray|None = None
     with st.container():
         to_filter_columns = st.multiselect(
             "Filter dataframe on",
@@ -40,17 +49,21 @@ def df_explorer(df: pd.DataFrame, key: str|None = None, case: bool = False) -> p
             # Treat columns with < 10 unique values as categorical
             if isinstance(df[column].dtype, pd.CategoricalDtype):
                 left.write("↳")
+                uniques = index.uniques(column)
                 filters[column] = right.multiselect(
                     f"Values for {column}",
-                    df[column].unique(),
-                    default=list(df[column].unique()),
+                    uniques,
+                    default=uniques,
                     key=f"{random_key_base}_{column}",
                 )
-                df = df[df[column].isin(filters[column])]
+                positions = index.intersect(positions, index.isin(column, filters[column]))
             elif is_numeric_dtype(df[column]):
                 left.write("↳")
-                _min = float(df[column].min())
-                _max = float(df[column].max())
+                values, _ = index.sorted_index(column)
+                if len(values) == 0:
+                    continue
+                _min = float(values[0])
+                _max = float(values[-1])
                 step = (_max - _min) / 100
                 filters[column] = right.slider(
                     f"Values for {column}",
@@ -60,21 +73,24 @@ def df_explorer(df: pd.DataFrame, key: str|None = None, case: bool = False) -> p
                     step=step,
                     key=f"{random_key_base}_{column}",
                 )
-                df = df[df[column].between(*filters[column])]
+                positions = index.intersect(positions, index.range(column, *filters[column]))
             elif is_datetime64_any_dtype(df[column]):
                 left.write("↳")
+                values, _ = index.sorted_index(column)
+                if len(values) == 0:
+                    continue
                 filters[column] = right.date_input(
                     f"Values for {column}",
                     value=(
-                        df[column].min(),
-                        df[column].max(),
+                        values[0],
+                        values[-1],
                     ),
                     key=f"{random_key_base}_{column}",
                 )
                 if len(filters[column]) == 2:
                     filters[column] = tuple(map(pd.to_datetime, filters[column]))
                     start_date, end_date = filters[column]
-                    df = df.loc[df[column].between(start_date, end_date)]
+                    positions = index.intersect(positions, index.range(column, start_date, end_date))
             else:
                 left.write("↳")
                 filters[column] = right.text_input(
@@ -82,27 +98,27 @@ def df_explorer(df: pd.DataFrame, key: str|None = None, case: bool = False) -> p
                     key=f"{random_key_base}_{column}",
                 )
                 if filters[column]:
-                    result = df[column].str.contains(filters[column], case=case).fillna(False)
-                    # st.dataframe(result)
-                    df = df[result]
+                    positions = index.intersect(positions, index.contains(column, filters[column], case=case))
 
-    return df
+    return index.take(positions)
 
 DateSelectOptions = Literal['All', 'Last year', 'Last 90 Days', 'Last 30 Days', 'Last Week', 'Specific Year', 'Custom']
 DATE_SELECT_DEFAULT: list[DateSelectOptions] = ['All', 'Last year', 'Last 90 Days', 'Last 30 Days', 'Last Week', 'Specific Year', 'Custom' ]
 
-def df_date_filter(df: pd.DataFrame, key: str, from_now: bool = False,
+def df_date_range(df: pd.DataFrame, key: str, from_now: bool = False,
     options: list[DateSelectOptions] = DATE_SELECT_DEFAULT, default: DateSelectOptions|None = None,
-    use_container_width: bool = True
-):
+) -> tuple[pd.Timestamp|None, pd.Timestamp]|None:
     """
-    Filter a DataFrame by date range.
+    Let the user select a date range. The selection is returned as plain values, so that it can
+    be part of the key of cached results (see monjour_app_cache).
     Args:
-        df:         Original dataframe
+        df:         Original dataframe (used for the default end date and the list of years)
         key:        Key to use for the widgets
         from_now:   If True, the end date will be the current date. Defaults to False.
         options:    List of options for the date range. Defaults to DATE_SELECT_DEFAULT.
         default:    Default selection. Defaults to None.
+    Returns:
+        (start, end), start is None if the user selected all the dates. None if the user selected nothing.
     """
     if default is None:
         default = options[0]
@@ -111,7 +127,7 @@ def df_date_filter(df: pd.DataFrame, key: str, from_now: bool = False,
 
     end = pd.Timestamp.now() if from_now else df['date'].max()
     if selection == 'All':
-        return df
+        return None, end
     elif selection == 'Last year':
         start = end - pd.DateOffset(years=1)
     elif selection == 'Last 90 Days':
@@ -126,6 +142,8 @@ def df_date_filter(df: pd.DataFrame, key: str, from_now: bool = False,
         end = pd.Timestamp(year, 12, 31)
 
     elif selection == 'Custom':
+        # streamlit_extras is only imported by the pages that use a custom range
+        from streamlit_extras.mandatory_date_range import date_range_picker
         start = end - pd.DateOffset(days=30)
         result = date_range_picker('Select the date range', default_start=start, default_end=end,
             max_date=pd.Timestamp.now(), key=key_combine(key, 'df_date_filter_custom'))
@@ -134,7 +152,27 @@ def df_date_filter(df: pd.DataFrame, key: str, from_now: bool = False,
     else:
         # User selected nothing
         st.warning('Select a date range')
-        return df.head()
+        return None
 
-    return df[df['date'] >= start]
+    return start, end
 
+def df_date_filter(df: pd.DataFrame, key: str, from_now: bool = False,
+    options: list[DateSelectOptions] = DATE_SELECT_DEFAULT, default: DateSelectOptions|None = None,
+    use_container_width: bool = True
+):
+    """
+    Filter a DataFrame by date range.
+    Args:
+        df:         Original dataframe
+        key:        Key to use for the widgets
+        from_now:   If True, the end date will be the current date. Defaults to False.
+        options:    List of options for the date range. Defaults to DATE_SELECT_DEFAULT.
+        default:    Default selection. Defaults to None.
+    """
+    date_range = df_date_range(df, key, from_now=from_now, options=options, default=default)
+    if date_range is None:
+        return df.head()
+    start, _ = date_range
+    if start is None:
+        return df
+    return df[df['date'] >= start]
@@ -0,0 +1,75 @@
+import math
+import numpy as np
+import pandas as pd
+import streamlit as st
+from typing import Any
+
+from monjour.st.utils import key_combine
+
+def sort_positions(df: pd.DataFrame, column: str, ascending: bool) -> np.ndarray|None:
+    """
+    Positions of the rows of df sorted by column (stable, missing values last).
+    Returns None if the frame is already in the requested order, so that pages can be sliced directly.
+    """
+    values = df[column]
+    if ascending and values.is_monotonic_increasing:
+        return None
+    # Sort a copy of the column with a positional index, so that the sorted index are the positions
+    values = values.reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+def paginated_table(
+    df: pd.DataFrame,
+    key: str,
+    page_size: int = 100,
+    default_sort: str|None = None,
+    ascending: bool = False,
+    column_config: dict[str, Any]|None = None,
+    column_order: list[str]|None = None,
+    show_index: str|None = None,
+):
+    """
+    Display a DataFrame one page at a time. Sorting and slicing are done on the server and only
+    the rows of the visible page are sent to the browser, so the cost of a rerun doesn't depend on
+    the number of rows.
+
+    Args:
+        df:             DataFrame to display (already filtered).
+        key:            Key to use for the widgets.
+        page_size:      Default number of rows per page.
+        default_sort:   Column sorted by default. Defaults to the first column.
+        ascending:      Default sort direction.
+        column_config:  Passed to st.dataframe.
+        column_order:   Passed to st.dataframe. Also the columns offered for sorting.
+        show_index:     If set, the index is shown as a column with this name.
+    """
+    sortable = [c for c in (column_order or df.columns) if c in df.columns]
+    if default_sort is None or default_sort not in sortable:
+        default_sort = sortable[0] if len(sortable) > 0 else None
+
+    c1, c2, c3, c4 = st.columns([0.35, 0.2, 0.2, 0.25], vertical_alignment='bottom')
+    sort_column = c1.selectbox('Sort by', sortable, index=sortable.index(default_sort) if default_sort else 0,
+                               key=key_combine(key, 'sort_column'))
+    sort_ascending = c2.toggle('Ascending', value=ascending, key=key_combine(key, 'sort_ascending'))
+    page_sizes = sorted({ 25, 50, 100, 250, 500, page_size })
+    rows_per_page = c3.selectbox('Rows per page', page_sizes, index=page_sizes.index(page_size),
+                                 key=key_combine(key, 'page_size'))
+    n_pages = max(1, math.ceil(len(df) / rows_per_page))
+    # The filters may have reduced the number of pages since the last rerun
+    page_key = key_combine(key, 'page')
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    page = c4.number_input(f'Page (of {n_pages})', min_value=1, max_value=n_pages, value=1,
+                           key=page_key)
+
+    start = (int(page) - 1) * rows_per_page
+    end = min(start + rows_per_page, len(df))
+    positions = None if sort_column is None else sort_positions(df, sort_column, sort_ascending)
+    # Only the rows of the visible page are materialized
+    page_df = df.iloc[start:end] if positions is None else df.iloc[positions[start:end]]
+
+    if show_index is not None:
+        page_df = page_df.rename_axis(show_index).reset_index()
+    st.dataframe(page_df, column_config=column_config, column_order=column_order,
+                 hide_index=True, use_container_width=True)
+    st.write(f"Showing rows {start + 1 if end > 0 else 0}-{end} of {len(df)}.")
@@ -6,7 +6,7 @@ from monjour.st.utils import use_state
 
 def archive_editor(st_app: StApp, page: str):
     msgs = use_state(page, 'archive_messages', list).get()
-    df = st_app.app.archive.df # already cached by archive
+    df = st_app.app.snapshot.archive_df # already cached by the snapshot
 
     st.data_editor(
         df,
@@ -38,7 +38,7 @@ def archive_editor(st_app: StApp, page: str):
                 msgs.append(lambda: st.error(f"You cannot remove {record['id']} from the archive as it is managed externally. Reload the page to reset the deleted rows."))
             else:
                 msgs.append(lambda: st.info(f"Removed {record['id']} from the archive"))
-                st_app.app.archive.forget_file(record['id'])
+                st_app.app._forget_file(record['id'])
         st.session_state.archive_editor['deleted_rows'] = []
 
     for msg in msgs:
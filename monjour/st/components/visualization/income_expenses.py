@@ -1,8 +1,11 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+from monjour.utils.downsample import downsample, CHART_MAX_POINTS
+
 def income_expense(df: pd.DataFrame, week_month: str = 'week'):
 
     amount_data = df.groupby([week_month, 'expense'], as_index=False).agg({'amount_abs': 'sum'})
@@ -42,8 +45,7 @@ def income_expense(df: pd.DataFrame, week_month: str = 'week'):
 
     return fig
 
-def income_expense_cumulative(df: pd.DataFrame):
-    df = df.copy()
+def income_expense_cumulative(df: pd.DataFrame, max_points: int|None = CHART_MAX_POINTS):
     cumulative_income = (
         df[df['expense'] == False]
         .groupby('date', as_index=False)
@@ -78,6 +80,11 @@ def income_expense_cumulative(df: pd.DataFrame):
         'cumulative_income': 'Income',
         'cumulative_expenses': 'Expenses'
     })
+    # One point per day is too much for multi-year ranges, keep the shape of each line
+    long_format = pd.concat([
+        downsample(group, 'date', 'amount', max_points, method='lttb')
+        for _, group in long_format.groupby('type', sort=False)
+    ])
 
     # Create a line chart
     fig = px.line(
@@ -100,9 +107,10 @@ def income_expense_cumulative(df: pd.DataFrame):
 
     return fig
 
-def balance(df: pd.DataFrame, week_month: str = 'week'):
+def balance(df: pd.DataFrame, week_month: str = 'week', max_points: int|None = CHART_MAX_POINTS):
     amount_data = df.groupby([week_month], as_index=False).agg({'amount': 'sum'})
-    amount_data['color'] = amount_data['amount'].apply(lambda x: 'green' if x > 0 else 'red')
+    amount_data = downsample(amount_data, week_month, 'amount', max_points)
+    amount_data['color'] = np.where(amount_data['amount'] > 0, 'green', 'red')
 
     label = 'Week' if week_month == 'week' else 'Month'
 
@@ -137,10 +145,10 @@ def balance(df: pd.DataFrame, week_month: str = 'week'):
 
     return fig
 
-def balance_cum(df: pd.DataFrame):
-    df = df.copy()
-    df['cumulative_amount'] = df['amount'].cumsum()
-    df['color'] = df['cumulative_amount'].apply(lambda x: 'green' if x > 0 else 'red')
+def balance_cum(df: pd.DataFrame, max_points: int|None = CHART_MAX_POINTS):
+    df = df[['week', 'amount']].assign(cumulative_amount=df['amount'].cumsum())
+    df = downsample(df, 'week', 'cumulative_amount', max_points)
+    df['color'] = np.where(df['cumulative_amount'] > 0, 'green', 'red')
 
     # Create figure
     fig = go.Figure()
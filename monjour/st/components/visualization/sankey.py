@@ -1,72 +1,128 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
-from monjour.st import StApp, monjour_app_cache
+from monjour.core.category import CATEGORY_SEPARATOR
+from monjour.core.snapshot import AppSnapshot
+from monjour.st import monjour_app_cache
 
-@monjour_app_cache(key='sankey_diagram')
-def sankey_diagram(st_app: StApp):
-    pass
-
-def sankey(income: pd.DataFrame, expenses: pd.DataFrame):
+TOTAL_NODE = 'Total'
 
-    total_income = income['amount_abs'].sum()
-    total_expenses = expenses['amount_abs'].sum()
+def sankey_links(flows: pd.DataFrame, levels: list[str], value: str = 'amount_abs') -> tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Build the nodes and links of a Sankey diagram from flow paths, without looping over the rows.
 
-    # Create central total node
-    central_total = min(total_income, total_expenses)
+    Every row of flows is a path through the diagram: the nodes of the path are the values of the
+    level columns (missing values are skipped, so paths can have different lengths) and the value
+    flows along every link of the path. Nodes are identified by their value, so paths sharing a node
+    (e.g. a parent category) merge there.
 
-    # Prepare links for Sankey diagram
-    links = []
+    Args:
+        flows:      One row per path.
+        levels:     Columns holding the nodes of the paths, in order.
+        value:      Column holding the value of each path.
 
-    # From income categories to central total
-    for _, row in income.iterrows():
-        links.append({
-            'source': row['category'],
-            'target': 'Total',
-            'value': row['amount_abs']
-        })
+    Returns:
+        (nodes, source, target, value): the node keys and, for every link, the codes of its source
+        and target nodes and its total value.
+    """
+    # Move the missing levels to the end of each path, so that consecutive columns are consecutive nodes
+    paths = flows[levels].to_numpy(dtype=object)
+    missing = pd.isna(paths)
+    order = np.argsort(missing, axis=1, kind='stable')
+    paths = np.take_along_axis(paths, order, axis=1)
+    missing = np.take_along_axis(missing, order, axis=1)
 
-    # From central total to expense categories
-    for _, row in expenses.iterrows():
-        links.append({
-            'source': 'Total',
-            'target': row['category'],
-            'value': row['amount_abs']
-        })
+    # One (source, target) pair per link of every path
+    valid = ~missing[:, :-1] & ~missing[:, 1:]
+    rows, steps = np.nonzero(valid)
+    codes, nodes = pd.factorize(np.concatenate([paths[rows, steps], paths[rows, steps + 1]]))
+    links = pd.DataFrame({
+        'source': codes[:len(rows)],
+        'target': codes[len(rows):],
+        'value': flows[value].to_numpy()[rows],
+    }).groupby(['source', 'target'], as_index=False, sort=False)['value'].sum()
+    return pd.Index(nodes), links['source'].to_numpy(), links['target'].to_numpy(), links['value'].to_numpy()
 
-    # Combine all unique nodes (income, total, expenses)
-    all_nodes = list(pd.concat([
-        pd.Series(income['category']),
-        pd.Series(['Total']),
-        pd.Series(expenses['category'])
-    ]).unique())
-
-    # Map nodes to indices for Plotly Sankey
-    node_indices = {node: i for i, node in enumerate(all_nodes)}
-    for link in links:
-        link['source_index'] = node_indices[link['source']]
-        link['target_index'] = node_indices[link['target']]
-
-    # Create Sankey diagram
+def sankey_figure(flows: pd.DataFrame, levels: list[str], value: str = 'amount_abs', title: str = '') -> go.Figure:
+    """Sankey diagram of flow paths (see sankey_links). Category nodes are labelled with their last component."""
+    nodes, source, target, values = sankey_links(flows, levels, value)
+    labels = pd.Series(nodes, dtype=object).astype(str).str.rsplit(CATEGORY_SEPARATOR, n=1).str[-1]
     fig = go.Figure(go.Sankey(
         node=dict(
             pad=15,
             thickness=20,
             line=dict(color="black", width=0.5),
-            label=all_nodes,
+            label=labels.tolist(),
+            customdata=nodes.tolist(),
+            hovertemplate='%{customdata}<extra></extra>',
             color="blue"
         ),
         link=dict(
-            source=[link['source_index'] for link in links],
-            target=[link['target_index'] for link in links],
-            value=[link['value'] for link in links],
-            color="rgba(44, 160, 101, 0.6)" 
+            source=source,
+            target=target,
+            value=values,
+            color="rgba(44, 160, 101, 0.6)"
         )
     ))
 
     fig.update_layout(
-        title_text="Sankey Diagram: Income to Expenses",
+        title_text=title,
         font_size=10
     )
 
-    return fig
\ No newline at end of file
+    return fig
+
+@monjour_app_cache(key='sankey_diagram')
+def sankey_diagram(snapshot: AppSnapshot, start: pd.Timestamp|None = None, income_categories: tuple[str, ...]|None = None,
+                   expense_categories: tuple[str, ...]|None = None, by_account: bool = True) -> go.Figure:
+    """
+    Sankey diagram of the flows from the income categories to the expense categories, through their
+    whole hierarchy (Total -> category -> subcategory -> ... -> account). Computed from the aggregate
+    cube of the snapshot and cached per version of the snapshot and arguments.
+
+    Args:
+        snapshot:           The snapshot to read the cube and the category tree from.
+        start:              Only include the cube rows from this date.
+        income_categories:  Income categories to include. Defaults to all of them.
+        expense_categories: Expense categories to include. Defaults to all of them.
+        by_account:         If True, the expense paths end at the account that paid them.
+    """
+    cells = snapshot.cube.df
+    if start is not None:
+        cells = cells[cells['date'] >= start]
+    totals = snapshot.cube.totals(['category', 'account_id'] if by_account else ['category'], df=cells)
+    totals['amount_abs'] = totals['amount'].abs()
+
+    # The top level of the categories tells income and expenses apart, then it is replaced by the total
+    paths = snapshot.category_tree.paths(totals['category'])
+    is_expense = paths[0].str.startswith('Expense').fillna(False).to_numpy(dtype=bool)
+    paths[0] = TOTAL_NODE
+    levels = list(paths.columns)
+    selected = np.ones(len(totals), dtype=bool)
+    if income_categories is not None:
+        selected &= is_expense | totals['category'].isin(income_categories).to_numpy()
+    if expense_categories is not None:
+        selected &= ~is_expense | totals['category'].isin(expense_categories).to_numpy()
+
+    # Income flows up its hierarchy into the total, the total flows down the hierarchy of the expenses
+    income = paths[~is_expense & selected][levels[::-1]]
+    income.columns = levels
+    expenses = paths[is_expense & selected].copy()
+    if by_account:
+        expenses[len(levels)] = totals['account_id']
+    flows = pd.concat([income, expenses], ignore_index=True)
+    flows['amount_abs'] = np.concatenate([
+        totals['amount_abs'].to_numpy()[~is_expense & selected],
+        totals['amount_abs'].to_numpy()[is_expense & selected],
+    ])
+    return sankey_figure(flows, [c for c in flows.columns if c != 'amount_abs'],
+                         title="Sankey Diagram: Income to Expenses")
+
+def sankey(income: pd.DataFrame, expenses: pd.DataFrame):
+    """Two-level Sankey diagram: income categories -> total -> expense categories."""
+    flows = pd.concat([
+        pd.DataFrame({'source': income['category'], 'target': TOTAL_NODE, 'amount_abs': income['amount_abs']}),
+        pd.DataFrame({'source': TOTAL_NODE, 'target': expenses['category'], 'amount_abs': expenses['amount_abs']}),
+    ], ignore_index=True)
+    return sankey_figure(flows, ['source', 'target'], title="Sankey Diagram: Income to Expenses")
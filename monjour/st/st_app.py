@@ -1,33 +1,135 @@
 import streamlit as st
+import functools
 import importlib
+import sys
+import threading
+import datetime as dt
+import numpy as np
 import pandas as pd
 
+from collections import OrderedDict
 from streamlit.navigation.page import StreamlitPage
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any, Callable, Hashable
 
-from monjour.app import App
+from monjour.app import App, RunProgress
+from monjour.core.common import TIME_BUCKETS
+from monjour.core.cube import expense_flags
 from monjour.core.importer import ImporterInfo
+from monjour.core.snapshot import AppSnapshot
+
+# Columns that can be added to the views returned by StApp.view, besides the TIME_BUCKETS (see
+# AppSnapshot.buckets). Computed only for the rows of the view
+VIEW_DERIVED_COLUMNS: dict[str, Callable[[pd.DataFrame], pd.Series]] = {
+    'expense': expense_flags,
+    'amount_abs': lambda df: df['amount'].abs(),
+}
 
 @st.cache_resource
 def get_st_app(home_dir: Path|str):
     return StApp(home_dir)
 
-def monjour_app_cache(key: str):
-    def decorator(func: Callable[["StApp"], Any]):
-        added_listener = False
-        def wrapper(st_app: "StApp"):
-            def wrapper2(st_app: "StApp"):
-                if (value := st.session_state.get(key)) is not None:
-                    return value
-                st.session_state[key] = value = func(st_app)
-                return value
-            if not added_listener:
-                def listener(_):
-                    if key in st.session_state:
-                        del st.session_state[key]
-                st_app.app._add_df_listener(listener)
-            return wrapper2(st_app)
+class AppResultCache:
+    """
+    Process-wide cache of values computed from the master account, shared by all the browser sessions.
+
+    Entries are keyed by (function key, App.df version, arguments): when the master account is replaced
+    its version changes and the old entries are simply never hit again, until they are evicted.
+    Eviction is LRU, bounded both by the number of entries and by the (estimated) memory they use.
+
+    Attributes:
+        max_entries:    Maximum number of entries.
+        max_bytes:      Maximum estimated size of all the entries.
+    """
+    max_entries: int
+    max_bytes: int
+
+    _entries: OrderedDict[Hashable, tuple[Any, int]]
+    _bytes: int
+    _lock: threading.Lock
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """Returns (True, value) if the key is cached, (False, None) otherwise."""
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        size = self.estimate_size(value)
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                # Too big to be cached, don't evict everything else for it
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @staticmethod
+    def estimate_size(value: Any) -> int:
+        """Estimate the memory used by a cached value."""
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            usage = value.memory_usage(deep=True)
+            return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if hasattr(value, 'to_plotly_json'):
+            # Plotly figures hold their data as arrays/lists inside the traces
+            return AppResultCache.estimate_size(value.to_plotly_json())
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(AppResultCache.estimate_size(v) for v in value)
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(AppResultCache.estimate_size(v) for v in value.values())
+        return sys.getsizeof(value)
+
+APP_RESULT_CACHE = AppResultCache()
+
+def monjour_app_cache(key: str|None = None):
+    """
+    Cache the result of a function of the master account in APP_RESULT_CACHE.
+
+    The decorated function takes as first argument the AppSnapshot it reads (see App.snapshot),
+    followed by any number of hashable arguments. The result is cached under the version of that
+    snapshot, so a snapshot published while the function runs can't be cached under an older version.
+    Pages take App.snapshot once and pass it to every cached function.
+
+    Args:
+        key: Name of the function in the cache. Defaults to the qualified name of the function.
+    """
+    def decorator(func: Callable[..., Any]):
+        func_key = key or f"{func.__module__}.{func.__qualname__}"
+        @functools.wraps(func)
+        def wrapper(snapshot: AppSnapshot, *args, **kwargs):
+            cache_key = (func_key, snapshot.version, args, tuple(sorted(kwargs.items())))
+            found, value = APP_RESULT_CACHE.get(cache_key)
+            if not found:
+                value = func(snapshot, *args, **kwargs)
+                APP_RESULT_CACHE.set(cache_key, value)
+            return value
         return wrapper
     return decorator
 
@@ -37,12 +139,23 @@ class StApp:
     config_module: Any
     dirty: bool = True
 
-    _df_listeners: list[Callable[["StApp"], Any]] = []
+    # Progress of the current (or last) run and the exception that made it fail, if any
+    progress: RunProgress|None
+    run_error: BaseException|None
+
+    _df_listeners: list[Callable[["StApp"], Any]]
+    _run_thread: threading.Thread|None
+    _run_lock: threading.Lock
 
     def __init__(self, home_dir: Path|str):
         if isinstance(home_dir, str):
             home_dir = Path(home_dir)
         self.home_dir = home_dir
+        self.progress = None
+        self.run_error = None
+        self._df_listeners = []
+        self._run_thread = None
+        self._run_lock = threading.Lock()
 
         self.config_module = importlib.import_module('configuration')
         self.app = self.config_module.app
@@ -71,15 +184,87 @@ class StApp:
         acc = self.app.accounts[account_id]
         return acc.get_available_importers()
 
+    ########################################################
+    # Data access
+    ########################################################
+
+    def view(
+        self,
+        start: dt.datetime|None = None,
+        end: dt.datetime|None = None,
+        columns: list[str]|None = None,
+        derived: list[str] = [],
+    ) -> pd.DataFrame:
+        """
+        Read-only view of the master account of the current snapshot, sorted by date.
+
+        The date range is found with a binary search on the date order of the snapshot (see
+        AppSnapshot.date_index), so the cost of a view depends on the number of its rows, not on the
+        size of the master account. When App.df is already sorted by date and all the columns are
+        selected, the view is a slice sharing its buffers with App.df and must not be modified.
+        The time buckets are sliced from AppSnapshot.buckets, the other derived columns are computed
+        only for the rows of the view.
+
+        Args:
+            start:      First date to include. Defaults to the first transaction.
+            end:        Last date to include (inclusive). Defaults to the last transaction.
+            columns:    Columns to include. Defaults to all the columns.
+            derived:    Derived columns to add. Any of TIME_BUCKETS or VIEW_DERIVED_COLUMNS ('expense', 'amount_abs').
+        """
+        snapshot = self.app.snapshot
+        df = snapshot.df
+        rows: slice|np.ndarray = slice(None)
+        if 'date' in df.columns:
+            order, dates = snapshot.date_index
+            lo = 0 if start is None else dates.searchsorted(pd.Timestamp(start), side='left')
+            hi = len(df) if end is None else dates.searchsorted(pd.Timestamp(end), side='right')
+            # Only the rows of the view are copied when the master account isn't sorted by date
+            rows = slice(lo, hi) if order is None else order[lo:hi]
+            df = df.iloc[rows]
+        extra = {
+            name: snapshot.buckets[name].iloc[rows].to_numpy() if name in TIME_BUCKETS else VIEW_DERIVED_COLUMNS[name](df)
+            for name in derived
+        }
+        if columns is not None:
+            df = df[columns]
+        if len(extra) > 0:
+            df = df.assign(**extra)
+        return df
+
     ########################################################
     # Commands
     ########################################################
 
-    def run(self, force: bool = False):
-        if self.dirty or force:
-            self.app.run()
-            self._call_df_listeners()
+    def run(self, force: bool = False, background: bool = False):
+        """
+        Run the app (load the archive and merge the accounts) if it is dirty.
+
+        Args:
+            force:      Run even if the app is not dirty.
+            background: Run in a background thread and return immediately. The progress is
+                        available in StApp.progress and pages can wait for it with wait_for_app().
+        """
+        with self._run_lock:
+            if not (self.dirty or force) or self.is_running:
+                return
             self.dirty = False
+            self.run_error = None
+            self.progress = RunProgress('loading')
+            if background:
+                self._run_thread = threading.Thread(target=self._run, name='monjour-app-run', daemon=True)
+                self._run_thread.start()
+                return
+        self._run()
+
+    @property
+    def is_running(self) -> bool:
+        return self._run_thread is not None and self._run_thread.is_alive()
+
+    def wait(self, timeout: float|None = None) -> bool:
+        """Wait for a background run to finish. Returns False if the timeout expired."""
+        if (thread := self._run_thread) is not None:
+            thread.join(timeout)
+        return not self.is_running
 
     ########################################################
     # Utils
@@ -96,6 +281,24 @@ class StApp:
     def add_df_listener(self, func: Callable[["StApp"], Any]):
         self._df_listeners.append(func)
 
+    def _run(self):
+        def on_progress(progress: RunProgress):
+            self.progress = progress
+        try:
+            # App.merge_accounts replaces App.df with a single assignment once the merge is
+            # complete, so pages never see a partially merged frame
+            self.app.run(progress=on_progress)
+            # Build the text search indexes now rather than on the first search of a user
+            self.app.snapshot.index.build_text_indexes()
+            # Files dropped in the inbox are imported from now on (the archive is loaded)
+            if self.app.inbox is not None:
+                self.app.inbox.start()
+            self._call_df_listeners()
+        except BaseException as e:
+            self.run_error = e
+            self.dirty = True
+            raise
+
     def _call_df_listeners(self):
         for listener in self._df_listeners:
             listener(self)
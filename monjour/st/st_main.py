@@ -18,8 +18,16 @@ st_lib_home = Path(os.path.dirname(__file__))
 st.session_state.project_dir = os.path.realpath(os.path.curdir)
 st_app = get_st_app(st.session_state.project_dir)
 
-# Will only run if the app is dirty
-st_app.run()
+# Will only run if the app is dirty. The archive is loaded in a background thread, pages
+# that need the master account wait for it (see components.common.app_loading)
+st_app.run(background=True)
+
+# Notify the session of the files imported from the inbox since its previous rerun
+if (inbox := st_app.app.inbox) is not None:
+    seen = st.session_state.get('inbox_seen', len(inbox.imported))
+    for imported in inbox.imported[seen:]:
+        st.toast(f"Imported {Path(imported.filename).name} into '{imported.account_id}'", icon='📥')
+    st.session_state.inbox_seen = len(inbox.imported)
 
 ######################################
 # Pages
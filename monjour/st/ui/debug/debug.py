@@ -8,8 +8,10 @@ from monjour.core.executor import RecordingExecutor
 from monjour.st import get_st_app
 from monjour.st.components.general.file_import import FileImportOptions, file_import_options
 from monjour.st.components.common.diff import show_diff
+from monjour.st.components.common.app_loading import wait_for_app
 
 main_app = get_st_app(st.session_state.project_dir)
+wait_for_app(main_app)
 
 @st.cache_resource
 def _app_for_import():
@@ -21,7 +21,7 @@ app = st_app.app
 
 st.title("Archive")
 
-records = sorted(app.archive.records.values(), key=lambda r: r['imported_date'], reverse=True)
+records = sorted(app.snapshot.archive_records.values(), key=lambda r: r['imported_date'], reverse=True)
 if len(records) > 0:
     last_imported_date = records[0]['imported_date'].strftime("%Y-%m-%d %H:%M:%S")
 else:
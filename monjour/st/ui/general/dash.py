@@ -1,17 +1,23 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from streamlit_extras.add_vertical_space import add_vertical_space
 
+from monjour.core.snapshot import AppSnapshot
 from monjour.st import get_st_app, StApp
 
 from monjour.st.components.common.df_explorer import df_explorer, df_date_filter
+from monjour.st.components.common.app_loading import wait_for_app
+from monjour.st.components.common.paginated_table import paginated_table
 from monjour.st.utils.master_df import get_column_config, MAIN_DF_RELEVANT_COLUMNS
 
 from monjour.st.utils import cache
+from monjour.utils.downsample import histogram_bins
 
 st_app = get_st_app(st.session_state.project_dir)
 app = st_app.app
+wait_for_app(st_app)
+# Read everything from the same snapshot, imports in other sessions publish new ones
+snapshot = app.snapshot
 
 st.title("Dashboard")
 
@@ -20,29 +26,30 @@ st.title("Dashboard")
 #####################################
 
 c1, c2, c3 = st.columns(3)
-c1.metric("Transactions", len(st_app.app.df))
+c1.metric("Transactions", len(snapshot.df))
 c2.metric("Accounts", len(st_app.app.accounts))
-c3.metric("Files imported", len(st_app.app.archive.records))
+c3.metric("Files imported", len(snapshot.archive_records))
 
 #####################################
 # Spending trend
 #####################################
 
 @cache.monjour_app_cache(key='dash_freqency_chart')
-def freqency_chart(st_app: StApp):
-    df = st_app.app.df
-    df = df.copy()
-    df['day'] = df['date'].dt.to_period('D').apply(lambda r: r.start_time)
-    by_day = df.groupby('day').agg({'day': 'count'}).rename(columns={'day': 'count'}).reset_index()
-    fig = px.histogram(
-        by_day,
+def freqency_chart(snapshot: AppSnapshot):
+    # The dashboard is the landing page, plotly is only imported once the chart is built
+    import plotly.express as px
+    by_day = snapshot.cube.rollup('day')
+    # Bin on the server: the browser gets 100 bars instead of one point per day
+    bins = histogram_bins(by_day['day'], by_day['count'], n_bins=100)
+    fig = px.bar(
+        bins,
         x='day',
         y='count',
         title='Transactions per day',
         labels={'count': 'Number of transactions', 'day': 'Day'},
         # template='plotly_white',
-        nbins=100
     )
+    fig.update_layout(bargap=0)
     fig.update_traces(
         marker=dict(
             colorscale='Viridis',  # Choose a vibrant color scale
@@ -52,22 +59,24 @@ def freqency_chart(st_app: StApp):
     )
     return fig
 
-st.plotly_chart(freqency_chart(st_app), use_container_width=True)
+st.plotly_chart(freqency_chart(snapshot), use_container_width=True)
 
 #####################################
 # Accounts summary
 #####################################
 
 st.subheader("Accounts summary")
-records_df = app.archive.df.groupby('account_id').agg(
+records_df = snapshot.archive_df.groupby('account_id').agg(
     last_uploaded=('imported_date', 'max'),
     num_records=('account_id', 'count')
 )
-accounts_df = app.df.groupby('account_id').agg(
-    balance=('amount', 'sum'),
+accounts_df = snapshot.cube.df.groupby('account_id').agg(
     last=('date', 'max'),
     first=('date', 'min')
 )
+# Maintained by the accounts as files are merged (includes their opening balance)
+accounts_df['balance'] = [snapshot.account_balances[id].current if id in snapshot.account_balances else None
+                          for id in accounts_df.index]
 account_names = pd.DataFrame.from_records([{
     'account_id': acc.id,
     'name': acc.name,
@@ -94,22 +103,11 @@ st.dataframe(df[['account_id', 'name', 'provider', 'num_records', 'last_uploaded
 
 add_vertical_space(1)
 st.subheader("Transactions")
-filtered_df = df_explorer(st_app.app.df)
-
-c1, c2, c3 = st.columns([0.4, 0.2, 0.3], vertical_alignment='center')
-with c1:
-    filtered_df = df_date_filter(filtered_df, key='dash', options=['All', 'Last year', 'Last 90 Days'])
-with c2:
-    limit_enabled = c2.toggle('Limit', key='home_limit', value=True)
-with c3:
-    limit_num = c3.number_input('Number of transactions', min_value=1, key='home_limit_value', value=100)
-
-# Apply limit if only when toggle is enabled
-if limit_enabled:
-    filtered_df = filtered_df.head(limit_num)
-
-filtered_df = filtered_df.reset_index()
-st.dataframe(filtered_df, column_config=get_column_config(st_app), column_order=MAIN_DF_RELEVANT_COLUMNS + ['deterministic_id'],
-             hide_index=True, height=1000)
-
-st.write(f"Showing {len(filtered_df)} transactions of {len(st_app.app.df)} total transactions.")
\ No newline at end of file
+# Filters run on the server, only the visible page is sent to the browser
+filtered_df = df_explorer(snapshot.df, key='dash', index=snapshot.index)
+filtered_df = df_date_filter(filtered_df, key='dash', options=['All', 'Last year', 'Last 90 Days'])
+paginated_table(filtered_df, key='dash_transactions', page_size=100, default_sort='date', ascending=False,
+                column_config=get_column_config(st_app), column_order=MAIN_DF_RELEVANT_COLUMNS + ['deterministic_id'],
+                show_index='deterministic_id')
+
+st.write(f"{len(filtered_df)} transactions match the filters, of {len(snapshot.df)} total transactions.")
@@ -5,14 +5,16 @@ from monjour.st import get_st_app
 from monjour.core.account import Account
 
 from monjour.st.components.common.df_explorer import df_explorer, df_date_filter
+from monjour.st.components.common.app_loading import wait_for_app
 
 st_app = get_st_app(st.session_state.project_dir)
+wait_for_app(st_app)
 
 st.title("Data Editor")
 
-df = st_app.app.df[[ 'date', 'amount', 'currency', 'category', 'desc', 'notes', 'counterpart', 'location', ]]
+df = st_app.view(columns=[ 'date', 'amount', 'currency', 'category', 'desc', 'notes', 'counterpart', 'location', ])
 
 
-df = df_explorer(df)
+df = df_explorer(df, key=__name__)
 df = df_date_filter(df, key=__name__)
 st.data_editor(df, height=800)
\ No newline at end of file
@@ -4,39 +4,62 @@ import datetime as dt
 import pandas as pd
 import plotly.express as px
 
-from monjour.st import get_st_app
+from monjour.core.snapshot import AppSnapshot
+from monjour.st import get_st_app, monjour_app_cache
 from monjour.st.utils import key_combine
+from monjour.utils.downsample import CHART_MAX_POINTS
 
 from monjour.st.components.visualization import income_expenses
-from monjour.st.components.common.df_explorer import df_date_filter
+from monjour.st.components.common.df_explorer import df_date_range
+from monjour.st.components.common.app_loading import wait_for_app
 
 st_app = get_st_app(st.session_state.project_dir)
+wait_for_app(st_app)
 
 st.header("Income/Expenses Report")
 week_month: Any = st.segmented_control('Divide by', ['Week', 'Month', 'Day'],
                     key=key_combine(__name__, 'week_month'), default='Month')
 
-df = df_date_filter(st_app.app.df, key=__name__)
-df = df.copy()
+# Read everything from the same snapshot, imports in other sessions publish new ones
+snapshot = st_app.app.snapshot
+# Query the aggregate cube (daily sums per account/category/currency/sign) instead of the transactions
+date_range = df_date_range(snapshot.cube.df, key=__name__)
+if date_range is None:
+    st.stop()
+start, _ = date_range
+period = week_month.lower()
 
-df['expense'] = df['amount'] < 0
-df['day'] = df['date'].dt.to_period('D').apply(lambda r: r.start_time)
-df['week'] = df['date'].dt.to_period('W').apply(lambda r: r.start_time)
-df['month'] = df['date'].dt.to_period('M').apply(lambda r: r.start_time)
-df['amount_abs'] = df['amount'].abs()
-df = df.sort_values('date')
+def filter_cells(snapshot: AppSnapshot, start: pd.Timestamp|None) -> pd.DataFrame:
+    cells = snapshot.cube.df
+    return cells if start is None else cells[cells['date'] >= start]
 
-fig = income_expenses.income_expense(df, week_month=week_month.lower())
-st.plotly_chart(fig, use_container_width=True)
+# The figures are cached by (version of the snapshot, period, date range), so reruns that
+# don't change the data or the filters (e.g. other widgets, other sessions) don't rebuild them
+@monjour_app_cache(key='income_expenses_period_figures')
+def period_figures(snapshot: AppSnapshot, period: str, start: pd.Timestamp|None, max_points: int):
+    df = snapshot.cube.rollup(period, by=['expense'], df=filter_cells(snapshot, start))
+    # Expenses and income are separate cells, so the absolute value of a cell is the sum of the absolute amounts
+    df['amount_abs'] = df['amount'].abs()
+    return (
+        income_expenses.income_expense(df, week_month=period),
+        income_expenses.balance(df, week_month=period, max_points=max_points),
+    )
 
+@monjour_app_cache(key='income_expenses_day_of_week_figure')
+def day_of_week_figure(snapshot: AppSnapshot, start: pd.Timestamp|None):
+    days = snapshot.cube.rollup('day', by=['expense'], df=filter_cells(snapshot, start))
+    days = days.rename(columns={'day': 'date'})
+    days['amount_abs'] = days['amount'].abs()
+    return income_expenses.expense_by_day_of_the_week(days)
 
-fig = income_expenses.balance(df, week_month=week_month.lower())
-st.plotly_chart(fig, use_container_width=True)
+income_expense_fig, balance_fig = period_figures(snapshot, period, start, CHART_MAX_POINTS)
+
+st.plotly_chart(income_expense_fig, use_container_width=True)
+st.plotly_chart(balance_fig, use_container_width=True)
 
 # fig = income_expenses.balance_cum(df)
 # st.plotly_chart(fig, use_container_width=True)
 
-fig = income_expenses.expense_by_day_of_the_week(df)
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(day_of_week_figure(snapshot, start), use_container_width=True)
 
-st.write("Add decomposition of income. Interest etc...")
\ No newline at end of file
+st.write("Add decomposition of income. Interest etc...")
@@ -4,34 +4,47 @@ import datetime as dt
 import pandas as pd
 import plotly.express as px
 
-from monjour.st import get_st_app
+from monjour.core.snapshot import AppSnapshot
+from monjour.st import get_st_app, monjour_app_cache
 from monjour.st.utils import key_combine
 
-from monjour.st.components.common.df_explorer import df_date_filter
+from monjour.st.components.common.df_explorer import df_date_range
 from monjour.st.components.visualization import income_expenses
 from monjour.st.components.visualization import sankey
+from monjour.st.components.common.app_loading import wait_for_app
 
 st_app = get_st_app(st.session_state.project_dir)
+wait_for_app(st_app)
 
 st.title("Categories Report")
-df = df_date_filter(st_app.app.df, key=__name__)
-df = df.copy()
-
-# Aggregate total expenses by category
-category_data = (
-    df.groupby('category')
-    .agg({ 'category': 'count', 'amount': 'sum' })
-    .rename(columns={'category': 'count'})
-    .reset_index()
-)
-category_data['enable'] = True
-category_data['expense'] = category_data['category'].str.startswith('Expense')
-category_data['amount_abs'] = category_data['amount'].abs()
-category_data = category_data.sort_values('amount_abs', ascending=False)
-
-# Eliminate the first level of the category hierarchy for better visualization
-category_data['category_flat'] = category_data['category'].str.split('/').str[1:].str.join('/')
-
+snapshot = st_app.app.snapshot
+# The cube rows carry the number of transactions, so the totals don't need the transactions
+date_range = df_date_range(snapshot.cube.df, key=__name__)
+if date_range is None:
+    st.stop()
+start, _ = date_range
+
+# snapshot.category_rollup holds monthly totals that include the descendants of every node, while the
+# tables need the totals of the transactions assigned to each category, from any day. They are computed
+# on the integer node ids of the category tree and cached per version of the snapshot and date range
+@monjour_app_cache(key='report_categories_totals')
+def category_totals(snapshot: AppSnapshot, start: pd.Timestamp|None) -> pd.DataFrame:
+    cells = snapshot.cube.df if start is None else snapshot.cube.df[snapshot.cube.df['date'] >= start]
+    tree = snapshot.category_tree
+    nodes = tree.to_df()
+    # Every category with transactions of its own, including inner nodes (e.g. 'Income' next to 'Income/Salary')
+    category_data = tree.totals(cells).join(nodes, on='node_id').rename(columns={'name': 'category'})
+    category_data['enable'] = True
+    category_data['expense'] = nodes['name'].to_numpy()[category_data['top_level'].to_numpy()]
+    category_data['expense'] = category_data['expense'].str.startswith('Expense')
+    category_data['amount_abs'] = category_data['amount'].abs()
+    category_data = category_data.sort_values('amount_abs', ascending=False)
+
+    # Eliminate the first level of the category hierarchy for better visualization
+    category_data['category_flat'] = category_data['relative_name']
+    return category_data
+
+category_data = category_totals(snapshot, start)
 expenses = category_data[category_data['expense']]
 income = category_data[~category_data['expense']]
 
@@ -91,7 +104,8 @@ with c2:
 # Sankey diagram
 ##############################################
 
-# Draw the Sankey diagram
-fig = sankey.sankey(income, expenses)
+# Draw the Sankey diagram through the whole category hierarchy, down to the accounts. The figure is
+# cached per version of the snapshot and selection
+fig = sankey.sankey_diagram(snapshot, start, tuple(enabled_income['category']), tuple(enabled_expenses['category']))
 st.plotly_chart(fig, use_container_width=True, height=600)
 
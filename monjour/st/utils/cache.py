@@ -1,13 +1,13 @@
 import pandas as pd
 import streamlit as st
 
+from monjour.core.snapshot import AppSnapshot
 from monjour.st import monjour_app_cache, StApp, get_st_app
 
 @monjour_app_cache(key='line_chart_df')
-def line_chart_df(st_app: StApp):
-    df = st_app.app.df
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.to_period('M')
-    df_daily = df.groupby('month')['amount'].sum().reset_index()
+def line_chart_df(snapshot: AppSnapshot):
+    df = snapshot.df
+    month = snapshot.buckets['month']
+    df_daily = df['amount'].groupby(month).sum().rename_axis('month').reset_index()
     return df_daily
 
@@ -0,0 +1,118 @@
+"""
+Downsampling of time series for charts.
+
+A chart is at most a few thousand pixels wide, so sending one point per transaction or per day of
+a multi-year series only makes the payload bigger. The functions here reduce a series to a point
+budget while keeping what the eye sees: the minimum and the maximum of every bucket (minmax) or the
+points that preserve the shape of the line (LTTB, Largest-Triangle-Three-Buckets).
+
+The *_indices functions return the (sorted) positions of the points to keep, so that the other
+columns of the frame can be taken along (see downsample).
+"""
+import numpy as np
+import pandas as pd
+from typing import Literal
+
+# Default maximum number of points of a chart series
+CHART_MAX_POINTS = 2000
+
+DownsampleMethod = Literal['minmax', 'lttb']
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Split the series in max_points // 2 buckets of consecutive points and keep the first and last
+    point of the series plus the minimum and maximum of each bucket. Buckets holding only missing
+    values are skipped.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return np.arange(n)
+    n_buckets = max(1, (max_points - 2) // 2)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    keep = [np.array([0, n - 1])]
+    for start, end in zip(starts, ends):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        if np.isnan(bucket).all():
+            continue
+        keep.append(start + np.array([np.nanargmin(bucket), np.nanargmax(bucket)]))
+    return np.unique(np.concatenate(keep))
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last point, and from every bucket the point
+    forming the largest triangle with the point kept in the previous bucket and the average of the next one.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        # Twice the area of the triangles (previous point, candidate, average of the next bucket)
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        if end > start:
+            # Buckets (or neighbours) holding only missing values keep their first point
+            previous = start + (int(np.nanargmax(areas)) if not np.isnan(areas).all() else 0)
+        keep[i + 1] = previous
+    return np.unique(keep)
+
+def downsample(df: pd.DataFrame, x: str, y: str, max_points: int|None = CHART_MAX_POINTS,
+               method: DownsampleMethod = 'minmax') -> pd.DataFrame:
+    """
+    Reduce a series (sorted by x) to at most max_points rows, keeping its visual extremes.
+
+    Args:
+        df:             Frame holding the series, sorted by x.
+        x:              Column of the x values (numbers or dates).
+        y:              Column of the y values.
+        max_points:     Point budget. None disables downsampling.
+        method:         'minmax' keeps the minimum and maximum of each bucket (best for spiky series),
+                        'lttb' keeps the points that preserve the shape of the line.
+    """
+    if max_points is None or len(df) <= max_points:
+        return df
+    if method == 'minmax':
+        positions = minmax_indices(df[y].to_numpy(), max_points)
+    elif method == 'lttb':
+        xs = df[x]
+        xs = xs.astype('int64') if pd.api.types.is_datetime64_any_dtype(xs) else xs
+        positions = lttb_indices(xs.to_numpy(), df[y].to_numpy(), max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    return df.iloc[positions]
+
+def histogram_bins(x: pd.Series, weights: pd.Series|None = None, n_bins: int = 100) -> pd.DataFrame:
+    """
+    Bin a series (numbers or dates) on the server, so that a histogram is sent as n_bins bars instead
+    of the raw values. Returns a frame with the center of each bin (named like x) and its 'count'
+    (the sum of the weights of the values in the bin). Missing values are ignored, and an empty
+    series gives an empty frame.
+    """
+    is_date = pd.api.types.is_datetime64_any_dtype(x)
+    valid = x.notna().to_numpy()
+    if not valid.any():
+        return pd.DataFrame({ x.name: pd.Series(dtype=x.dtype if is_date else np.float64),
+                              'count': pd.Series(dtype=np.float64 if weights is not None else np.int64) })
+    values = x[valid].astype('int64').to_numpy() if is_date else x[valid].to_numpy(dtype=np.float64)
+    counts, edges = np.histogram(values, bins=n_bins, weights=None if weights is None else weights.to_numpy()[valid])
+    centers = (edges[:-1] + edges[1:]) / 2
+    return pd.DataFrame({
+        x.name: centers.astype('int64').astype(x.dtype) if is_date else centers,
+        'count': counts,
+    })
@@ -0,0 +1,104 @@
+import numpy as np
+from collections import deque
+from typing import Iterable
+
+class KeywordMatcher:
+    """
+    Multi-pattern substring matcher based on the Aho-Corasick algorithm.
+
+    All the keywords are compiled into a single automaton, so a text is scanned once
+    regardless of the number of keywords. When several keywords are found in the same text,
+    the one that was added first wins (same semantics as a list of 'if/elif' checks).
+
+    Example:
+        matcher = KeywordMatcher()
+        matcher.add('coffee')
+        matcher.add('bar')
+        matcher.find('Coffee Bar') # 0
+    """
+    case: bool
+    keywords: list[str]
+
+    # Automaton. Node 0 is the root
+    _goto: list[dict[str, int]]
+    _fail: list[int]
+    # Lowest keyword index that ends in this node (or in any node of its fail chain)
+    _best: list[int]
+    _built: bool
+
+    def __init__(self, case: bool = False):
+        self.case = case
+        self.keywords = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [-1]
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def add(self, keyword: str) -> int:
+        """Add a keyword to the matcher. Returns the index of the keyword."""
+        if len(keyword) == 0:
+            raise ValueError("Keywords cannot be empty")
+        if not self.case:
+            keyword = keyword.casefold()
+        index = len(self.keywords)
+        self.keywords.append(keyword)
+        node = 0
+        for char in keyword:
+            if (next_node := self._goto[node].get(char)) is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(-1)
+                self._goto[node][char] = next_node
+            node = next_node
+        if self._best[node] == -1:
+            self._best[node] = index
+        self._built = False
+        return index
+
+    def build(self):
+        """Compute the failure links. Called automatically on the first search."""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # Inherit the matches of the longest proper suffix
+                inherited = self._best[self._fail[child]]
+                if inherited != -1 and (self._best[child] == -1 or inherited < self._best[child]):
+                    self._best[child] = inherited
+        self._built = True
+
+    def find(self, text: str) -> int:
+        """
+        Scan the text once and return the index of the first-added keyword contained in it, or -1.
+        """
+        if not self._built:
+            self.build()
+        if not self.case:
+            text = text.casefold()
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        result = -1
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if (found := best[node]) != -1 and (result == -1 or found < result):
+                result = found
+                if result == 0:
+                    break
+        return result
+
+    def find_many(self, texts: Iterable[str|None]) -> np.ndarray:
+        """Vector version of find(). Missing values map to -1."""
+        return np.fromiter((-1 if not isinstance(t, str) else self.find(t) for t in texts), dtype=np.int64)
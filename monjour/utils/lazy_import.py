@@ -0,0 +1,34 @@
+from importlib import import_module
+from typing import Any, Callable
+
+def lazy_attributes(package: str, attributes: dict[str, str]) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    Implementation of the module-level __getattr__ and __dir__ of a package that re-exports names
+    from its submodules, importing each submodule only when one of its names is first used.
+
+    Importing the package stays cheap (no pandas, no importers...) and `from package import *` still
+    works as long as the package defines __all__.
+
+    Example:
+        __all__ = ['App', 'Category']
+        __getattr__, __dir__ = lazy_attributes(__name__, {
+            'App':      'monjour.app',
+            'Category': 'monjour.core.category',
+        })
+
+    Args:
+        package:    Name of the package (__name__).
+        attributes: Name of each re-exported attribute -> module defining it.
+    """
+    def __getattr__(name: str) -> Any:
+        if (module := attributes.get(name)) is None:
+            raise AttributeError(f"module '{package}' has no attribute '{name}'")
+        value = getattr(import_module(module), name)
+        # Cache it in the package, so that __getattr__ is not called again for this name
+        setattr(import_module(package), name, value)
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(import_module(package))) | set(attributes))
+
+    return __getattr__, __dir__
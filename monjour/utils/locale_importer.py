@@ -96,14 +96,30 @@ def with_locale_helper(helper_name: str = 'locale_helper', importers_module: str
     """
     def mixin(cls):
         module = importers_module or '.'.join([*cls.__module__.split('.')[0:-1], 'importers'])
-        locale_importer = getattr(import_module(module), helper_name)
-        setattr(cls, '_locale_helper', locale_importer)
+        # The importers module is imported the first time the helper is used, not when the account class is defined
+        setattr(cls, '_locale_helper', _LazyLocaleHelper(module, helper_name))
         setattr(cls, 'get_default_importer', _get_default_importer)
         setattr(cls, 'get_available_importers', _get_available_importers)
         setattr(cls, 'set_importer', _set_importer)
         return cls
     return mixin
 
+class _LazyLocaleHelper:
+    """Class attribute resolving to the LocaleImporter of an importers module, imported on first access."""
+    module: str
+    helper_name: str
+    helper: LocaleImporter|None
+
+    def __init__(self, module: str, helper_name: str):
+        self.module = module
+        self.helper_name = helper_name
+        self.helper = None
+
+    def __get__(self, instance, owner) -> LocaleImporter:
+        if self.helper is None:
+            self.helper = getattr(import_module(self.module), self.helper_name)
+        return self.helper
+
 def _get_default_importer(account, locale: str|None=None) -> Importer:
     return account._locale_helper.load_first(with_locale=locale)()
 
@@ -0,0 +1,65 @@
+import numpy as np
+from typing import Iterable
+
+TRIGRAM_SIZE = 3
+
+class TrigramIndex:
+    """
+    Inverted index from the (case-folded) trigrams of a list of texts to the ids of the texts
+    that contain them, used to speed up substring searches.
+
+    A text can contain a pattern only if it contains all the trigrams of the pattern, so the
+    intersection of the posting lists of the trigrams of the pattern is a (usually small) set of
+    candidates. The candidates must still be verified, since the trigrams may appear in a different order.
+
+    Example:
+        index = TrigramIndex(['Coffee Bar', 'Supermarket', 'Bar Sport'])
+        index.candidates('bar') # [0, 2]
+    """
+    case: bool
+    size: int
+
+    # trigram -> sorted ids of the texts containing it
+    _postings: dict[str, np.ndarray]
+
+    def __init__(self, texts: Iterable[str|None], case: bool = False):
+        self.case = case
+        postings: dict[str, list[int]] = {}
+        size = 0
+        for id, text in enumerate(texts):
+            size += 1
+            if not isinstance(text, str):
+                continue
+            if not case:
+                text = text.casefold()
+            for trigram in {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}:
+                postings.setdefault(trigram, []).append(id)
+        self.size = size
+        self._postings = { trigram: np.asarray(ids, dtype=np.int64) for trigram, ids in postings.items() }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def candidates(self, pattern: str) -> np.ndarray|None:
+        """
+        Ids of the texts that may contain pattern, sorted. Returns None if the pattern is too short
+        to narrow the search (every text is a candidate).
+        """
+        if len(pattern) < TRIGRAM_SIZE:
+            return None
+        if not self.case:
+            pattern = pattern.casefold()
+        trigrams = {pattern[i:i + TRIGRAM_SIZE] for i in range(len(pattern) - TRIGRAM_SIZE + 1)}
+        postings = []
+        for trigram in trigrams:
+            if (ids := self._postings.get(trigram)) is None:
+                return np.empty(0, dtype=np.int64)
+            postings.append(ids)
+        # Intersect the shortest lists first
+        postings.sort(key=len)
+        result = postings[0]
+        for ids in postings[1:]:
+            result = np.intersect1d(result, ids, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result